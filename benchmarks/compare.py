@@ -0,0 +1,52 @@
+"""Compares two result files of route_benchmark.py, e.g. before and after a change:
+
+    python benchmarks/compare.py benchmarks/results/<before>.json benchmarks/results/<after>.json
+"""
+import argparse
+import json
+
+METRICS = ['throughput_rps', 'p50_ms', 'p99_ms']
+
+
+def change(before, after):
+    if before is None or after is None:
+        return 'n/a'
+    if not before:
+        return f'{after:.4g}'
+    return f'{before:.4g} -> {after:.4g} ({(after - before) / before * 100:+.0f}%)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    for report, label in ((before, 'before'), (after, 'after')):
+        meta = report['meta']
+        print(f"{label}: {(meta['commit'] or 'unknown')[:10]}{' (dirty)' if meta['dirty'] else ''}, "
+              f"{meta['users']} users, {meta['bcrypt_rounds']} bcrypt rounds, {meta['timestamp']}")
+    if before['meta']['users'] != after['meta']['users']:
+        print("Warning: the runs used datasets of different sizes")
+
+    runs_before = {(run['backend'], run['mode']): run['results'] for run in before['runs']}
+    for run in after['runs']:
+        key = (run['backend'], run['mode'])
+        if key not in runs_before:
+            continue
+        print(f"\n{run['backend']}/{run['mode']}")
+        print(f"  {'scenario':<14}" + ''.join(f'{metric:<30}' for metric in METRICS))
+        for scenario, results in run['results'].items():
+            previous = runs_before[key].get(scenario, {})
+            if 'skipped' in results or 'requests' not in results:
+                continue
+            print(f"  {scenario:<14}" + ''.join(f'{change(previous.get(metric), results.get(metric)):<30}'
+                                                 for metric in METRICS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Deterministic synthetic datasets for the benchmarks, in both storage formats.
+
+Every user gets MOVIES_PER_USER movies picked from a shared catalog and writes one review.
+User i is named 'name-i', has the ID 'user-i' and the password PASSWORD.
+"""
+import json
+import os
+import sqlite3
+
+import bcrypt
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+MOVIES_PER_USER = 5
+MAX_CATALOG_SIZE = 20_000
+PASSWORD = 'password'
+BATCH_SIZE = 10_000
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+
+def user_id(index):
+    return f'user-{index}'
+
+
+def user_name(index):
+    return f'name-{index}'
+
+
+def movie_id(user_index, number):
+    return f'movie-{user_index}-{number}'
+
+
+def catalog_size(user_count):
+    return min(user_count * 2, MAX_CATALOG_SIZE)
+
+
+def catalog_entry(number):
+    imdb_id = f'tt{number:07d}'
+    return {'imdb_id': imdb_id, 'title': f'Movie {number}', 'rating': round(1 + number % 90 / 10, 1),
+            'year': 1950 + number % 75, 'poster': f'http://127.0.0.1/poster/{number}.jpg',
+            'director': f'Director {number % 500}', 'movie_link': f'https://www.imdb.com/title/{imdb_id}/'}
+
+
+def user_catalog_numbers(user_index, user_count):
+    size = catalog_size(user_count)
+    return [(user_index * 7 + number * 13) % size for number in range(MOVIES_PER_USER)]
+
+
+def password_hash(rounds):
+    return bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def cached_path(kind, user_count, rounds):
+    """Path of a seeded dataset, kept between runs since seeding a million users takes a while."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    extension = 'db' if kind == 'sqlite' else 'json'
+    return os.path.join(CACHE_DIR, f'{kind}-{user_count}-r{rounds}.{extension}')
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_sqlite(path, user_count, rounds, create_schema):
+    """Creates the schema with create_schema(path) (the app's migrations) and bulk-loads
+    the users, catalog, movies and reviews."""
+    temp_path = f'{path}.seeding'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    create_schema(temp_path)
+    hashed = password_hash(rounds)
+    connection = sqlite3.connect(temp_path)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    with connection:
+        catalog = [catalog_entry(number) for number in range(catalog_size(user_count))]
+        connection.executemany('INSERT INTO catalog_movie (imdb_id, title, rating, year, poster, director, '
+                               'movie_link) VALUES (:imdb_id, :title, :rating, :year, :poster, :director, '
+                               ':movie_link)', catalog)
+        for batch in _batches((user_id(index), user_name(index), hashed, None) for index in range(user_count)):
+            connection.executemany('INSERT INTO user (id, name, password, email) VALUES (?, ?, ?, ?)', batch)
+
+        def movie_rows():
+            for index in range(user_count):
+                for number, catalog_number in enumerate(user_catalog_numbers(index, user_count)):
+                    entry = catalog[catalog_number]
+                    yield (movie_id(index, number), user_id(index), entry['imdb_id'], entry['title'].lower(),
+                           entry['year'], entry['rating'])
+        for batch in _batches(movie_rows()):
+            connection.executemany('INSERT INTO movie (movie_id, user_id, imdb_id, sort_title, sort_year, '
+                                   'sort_rating, version) VALUES (?, ?, ?, ?, ?, ?, 1)', batch)
+
+        def review_rows():
+            for index in range(user_count):
+                reviewed = (index * 31 + 7) % user_count
+                yield (f'review-{index}', user_id(index), movie_id(reviewed, 0), 1 + index % 5, index % 17,
+                       f'{1 + index % 28:02d}-{1 + index % 12:02d}-{2015 + index % 10}',
+                       f'Review text {index}', f'Review {index}')
+        for batch in _batches(review_rows()):
+            connection.executemany('INSERT INTO review (review_id, user_id, movie_id, rating, likes, '
+                                   'publication_date, review_text, review_title) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   batch)
+    connection.execute('PRAGMA journal_mode = WAL')  # As left by the app's migrations
+    connection.execute('ANALYZE')
+    connection.close()
+    os.replace(temp_path, path)
+
+
+def seed_json(path, user_count, rounds):
+    """Writes a movies.json file one user at a time, so even a million users fit in memory."""
+    temp_path = f'{path}.seeding'
+    hashed = password_hash(rounds)
+    catalog = [catalog_entry(number) for number in range(catalog_size(user_count))]
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write('[')
+        for index in range(user_count):
+            movies = []
+            for number, catalog_number in enumerate(user_catalog_numbers(index, user_count)):
+                entry = catalog[catalog_number]
+                movies.append({'id': movie_id(index, number), 'title': entry['title'],
+                               'director': entry['director'], 'year': entry['year'], 'rating': entry['rating'],
+                               'poster': entry['poster'], 'movie_link': entry['movie_link']})
+            if index:
+                file.write(', ')
+            json.dump({'id': user_id(index), 'name': user_name(index), 'password': hashed, 'movies': movies}, file)
+        file.write(']')
+    os.replace(temp_path, path)
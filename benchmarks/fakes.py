@@ -0,0 +1,59 @@
+"""Local stand-ins for the OMDb and chat APIs, so benchmarks never leave the machine.
+
+The app reaches them through OMDB_URL and CHAT_API_URL; posters point at the same server.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# The smallest well-formed JPEG header is enough, the app never decodes it without Pillow
+POSTER_BYTES = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xd9'
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path.startswith('/poster'):
+            self._send(POSTER_BYTES, 'image/jpeg')
+            return
+        # OMDb: every title exists, with deterministic details
+        title = parse_qs(parts.query).get('t', ['Untitled'])[0]
+        digest = hashlib.sha1(title.lower().encode('utf-8')).hexdigest()
+        payload = {'Title': title, 'Year': str(1950 + int(digest[:4], 16) % 75), 'Director': 'Fake Director',
+                   'Ratings': [{'Source': 'Internet Movie Database', 'Value': f'{int(digest[4:6], 16) % 100 / 10}/10'}],
+                   'Poster': f'{self.server.base_url}/poster/{digest[:12]}.jpg',
+                   'imdbID': f'tt{int(digest[6:14], 16) % 10 ** 7:07d}', 'Response': 'True'}
+        self._send(json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # Chat API: the app only reads the 'text' field
+        self._send(json.dumps({'text': 'A fake recommendation for [[NAME]]: Fake Movie (1999).'}).encode('utf-8'),
+                   'application/json')
+
+
+def start_fake_apis(latency=0.0, host='127.0.0.1', port=0, handler=FakeApiHandler):
+    """Serves the fakes from a background thread. Returns the server; its base_url is set.
+    Tests may pass a FakeApiHandler subclass to change or record the answers."""
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.base_url = f'http://{host}:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, name='fake-apis', daemon=True).start()
+    return server
@@ -0,0 +1,95 @@
+"""Compares JSONDataManager's indexed lookups with the linear scans they replaced.
+
+Run from the repository root:
+
+    python benchmarks/json_lookup_benchmark.py [--users 10000 100000] [--lookups 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The data manager imports the rest of the app as the moviweb_app package
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from data_manager.json_storage_manager import JSONDataManager  # noqa: E402
+
+MOVIES_PER_USER = 5
+
+
+def make_data(user_count):
+    """Builds a synthetic movies.json payload."""
+    return [{'id': f'user-{index}', 'name': f'name-{index}', 'password': 'hash',
+             'movies': [{'id': f'movie-{index}-{number}', 'title': f'Movie {number}', 'director': 'Director',
+                         'year': 2000 + number, 'rating': 7.0, 'poster': '', 'movie_link': ''}
+                        for number in range(MOVIES_PER_USER)]}
+            for index in range(user_count)]
+
+
+# The lookups as they were written before the indexes
+def scan_user_by_id(data, user_id):
+    return next((user for user in data if user['id'] == user_id), None)
+
+
+def scan_user_by_name(data, user_name):
+    return next((user for user in data if user['name'] == user_name), None)
+
+
+def scan_user_movie(data, user_id, movie_id):
+    user_movies = next((user.get('movies') for user in data if user['id'] == user_id), None) or []
+    return next((movie for movie in user_movies if movie['id'] == movie_id), None)
+
+
+def time_per_call(func, arguments):
+    started_at = time.perf_counter()
+    for args in arguments:
+        func(*args)
+    return (time.perf_counter() - started_at) / len(arguments)
+
+
+def run(user_count, lookups):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'movies.json')
+        with open(filename, 'w') as file:
+            json.dump(make_data(user_count), file)
+        started_at = time.perf_counter()
+        data_manager = JSONDataManager(filename)
+        load_seconds = time.perf_counter() - started_at
+
+        # Every read checks the file for changes, so it must still exist
+        picks = [random.randrange(user_count) for _ in range(lookups)]
+        by_id = [(f'user-{index}',) for index in picks]
+        by_name = [(f'name-{index}',) for index in picks]
+        by_movie = [(f'user-{index}', f'movie-{index}-{MOVIES_PER_USER - 1}') for index in picks]
+        data = data_manager.data
+        results = {
+            'get_user_by_id': (time_per_call(lambda user_id: scan_user_by_id(data, user_id), by_id),
+                               time_per_call(data_manager.get_user_by_id, by_id)),
+            'get_user_by_name': (time_per_call(lambda name: scan_user_by_name(data, name), by_name),
+                                 time_per_call(data_manager.get_user_by_name, by_name)),
+            'get_user_movie': (time_per_call(lambda user_id, movie_id: scan_user_movie(data, user_id, movie_id),
+                                             by_movie),
+                               time_per_call(data_manager.get_user_movie, by_movie)),
+        }
+        print(f"\n{user_count} users (loaded and indexed in {load_seconds:.2f}s)")
+        print(f"{'operation':<20}{'scan (us)':>14}{'indexed (us)':>14}{'speed-up':>12}")
+        for name, (scan_seconds, indexed_seconds) in results.items():
+            print(f"{name:<20}{scan_seconds * 1e6:>14.1f}{indexed_seconds * 1e6:>14.2f}"
+                  f"{scan_seconds / indexed_seconds:>11.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+    for user_count in args.users:
+        run(user_count, args.lookups)
+
+
+if __name__ == '__main__':
+    main()
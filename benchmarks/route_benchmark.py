@@ -0,0 +1,371 @@
+"""Benchmarks the Flask routes and both storage backends on synthetic datasets.
+
+Seeds (or reuses) a dataset of the chosen size and measures throughput and latency of
+login, list users, list movies, movie details and add/update/delete movie:
+
+- sqlite/testclient: every route through the Flask test client, one request at a time
+- sqlite/server: every route over HTTP against benchmarks/serve.py with several workers
+- json/direct: the same operations on JSONDataManager (main.py only runs on SQLite,
+  and the JSON backend has no reviews, so movie details is skipped there)
+
+OMDb and the chat API are replaced by the local fakes in fakes.py. Results are written
+as JSON, to be compared across commits with compare.py. Run from the repository root:
+
+    python benchmarks/route_benchmark.py --size 1k [--backend sqlite json] [--mode testclient server]
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import datasets
+from fakes import start_fake_apis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SCENARIOS = ['login', 'list_users', 'list_movies', 'movie_details', 'add_movie', 'update_movie', 'delete_movie']
+
+
+def summarize(latencies, errors, wall_seconds):
+    """Throughput and latency percentiles of one scenario."""
+    ordered = sorted(latencies)
+
+    def percentile(share):
+        return round(ordered[min(len(ordered) - 1, round(share * (len(ordered) - 1)))] * 1000, 3)
+
+    if not ordered:
+        return {'requests': 0, 'errors': errors}
+    return {'requests': len(ordered), 'errors': errors,
+            'throughput_rps': round(len(ordered) / wall_seconds, 1),
+            'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+            'p50_ms': percentile(0.50), 'p99_ms': percentile(0.99), 'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(status) if status is not None else None}
+
+
+def create_schema(path):
+    """Creates an empty database with the app's own migrations."""
+    from flask import Flask
+    from data_manager.sqlite_manager import SQLiteDataManager
+    from data_manager.migrations import migrate
+    app = Flask('benchmark-schema')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    with app.app_context():
+        data_manager = SQLiteDataManager(app)
+        migrate(data_manager.db)
+        data_manager.db.engine.dispose()
+
+
+def dataset_copy(kind, user_count, rounds, work_dir):
+    """Copies the seeded dataset into the work directory, seeding it first if needed, so
+    writes made by the benchmark never leak into the next run."""
+    path = datasets.cached_path(kind, user_count, rounds)
+    if not os.path.exists(path):
+        print(f"Seeding {user_count} users into {path} ...")
+        started_at = time.perf_counter()
+        if kind == 'sqlite':
+            datasets.seed_sqlite(path, user_count, rounds, create_schema)
+        else:
+            datasets.seed_json(path, user_count, rounds)
+        print(f"Seeded in {time.perf_counter() - started_at:.1f}s")
+    copy = os.path.join(work_dir, f'{kind}-{os.path.basename(path)}')
+    shutil.copyfile(path, copy)
+    return copy
+
+
+def app_environment(work_dir, database_path, fakes_url, rounds):
+    """Environment that points the app at the dataset copy, the fakes and scratch cache files."""
+    return {'DATABASE_URL': database_path, 'SECRET_KEY': 'benchmark', 'MOVIE_API_KEY': 'fake',
+            'RAPID_API_KEY': 'fake', 'OMDB_URL': f'{fakes_url}/omdb/', 'CHAT_API_URL': f'{fakes_url}/chat/',
+            'OMDB_CACHE_PATH': os.path.join(work_dir, 'omdb_cache.db'),
+            'JOBS_DB_PATH': os.path.join(work_dir, 'jobs.db'),
+            'RECOMMENDATION_CACHE_PATH': os.path.join(work_dir, 'recommendations.db'),
+            'POSTER_DIR': os.path.join(work_dir, 'posters'),
+            'POSTER_INDEX_PATH': os.path.join(work_dir, 'posters.db'),
+            'BCRYPT_ROUNDS': str(rounds), 'SLOW_REQUEST_SECONDS': '3600'}
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data).status_code
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        return self.session.request(method, self.base_url + path, data=data, allow_redirects=False).status_code
+
+
+class Actor:
+    """One simulated user: logs in as a seeded user and works on their own movies."""
+
+    def __init__(self, number, user_index, session, user_count, database_path):
+        self.number = number
+        self.user_index = user_index
+        self.user_id = datasets.user_id(user_index)
+        self.session = session
+        self.user_count = user_count
+        self.database_path = database_path
+        self.random = random.Random(number)
+        self.added = 0
+        self.to_delete = []
+
+    def request(self, scenario):
+        """Sends one request of the scenario. Returns (status, expected status)."""
+        if scenario == 'login':
+            return self.session.request('POST', '/login', {'username': datasets.user_name(self.user_index),
+                                                           'password': datasets.PASSWORD}), 302
+        if scenario == 'list_users':
+            after = datasets.user_name(self.random.randrange(self.user_count))
+            return self.session.request('GET', f'/users?after={after}'), 200
+        if scenario == 'list_movies':
+            return self.session.request('GET', f'/users/{self.user_id}'), 200
+        if scenario == 'movie_details':
+            movie_id = datasets.movie_id(self.random.randrange(self.user_count), 0)
+            return self.session.request('GET', f'/movie_details/{movie_id}'), 200
+        if scenario == 'add_movie':
+            self.added += 1
+            title = f'Benchmark {self.number}-{self.added}'
+            return self.session.request('POST', f'/users/{self.user_id}/add_movie', {'movie': title}), 302
+        if scenario == 'update_movie':
+            movie_id = datasets.movie_id(self.user_index, self.random.randrange(datasets.MOVIES_PER_USER))
+            form = {'director': 'Updated Director', 'year': '2001', 'rating': '8.5', 'poster': 'N/A',
+                    'imdb_link': ''}
+            return self.session.request('POST', f'/users/{self.user_id}/update_movie/{movie_id}', form), 302
+        if scenario == 'delete_movie':
+            if not self.to_delete:
+                # The movies added earlier; the delete route takes the row ID
+                with sqlite3.connect(self.database_path) as connection:
+                    self.to_delete = [row[0] for row in connection.execute(
+                        "SELECT id FROM movie WHERE user_id = ? AND movie_id NOT LIKE 'movie-%'", (self.user_id,))]
+                if not self.to_delete:
+                    return None, None
+            return self.session.request('POST', f'/users/{self.user_id}/delete_movie/{self.to_delete.pop()}'), 302
+        raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+def run_scenarios(actors, requests_per_scenario, concurrent):
+    """Runs each scenario for all actors, in turn, and returns {scenario: summary}."""
+    per_actor = max(1, requests_per_scenario // len(actors))
+    results = {}
+    for scenario in SCENARIOS:
+        def work(actor):
+            latencies, errors = [], 0
+            for _ in range(per_actor):
+                started_at = time.perf_counter()
+                status, expected = actor.request(scenario)
+                if status is None:
+                    break
+                latencies.append(time.perf_counter() - started_at)
+                errors += status != expected
+            return latencies, errors
+
+        started_at = time.perf_counter()
+        if concurrent:
+            with ThreadPoolExecutor(max_workers=len(actors)) as pool:
+                outcomes = list(pool.map(work, actors))
+        else:
+            outcomes = [work(actor) for actor in actors]
+        wall_seconds = time.perf_counter() - started_at
+        results[scenario] = summarize([latency for latencies, _ in outcomes for latency in latencies],
+                                      sum(errors for _, errors in outcomes), wall_seconds)
+        print(f"  {scenario:<14}{json.dumps(results[scenario])}")
+    return results
+
+
+def actor_users(count, user_count):
+    """Spreads the actors over the dataset."""
+    return [number * max(1, user_count // count) % user_count for number in range(count)]
+
+
+def run_testclient(args, user_count, work_dir, fakes_url):
+    # In a child process, since main starts background threads that use the work directory
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_run_testclient, (args, user_count, work_dir, fakes_url))
+
+
+def _run_testclient(args, user_count, work_dir, fakes_url):
+    database_path = dataset_copy('sqlite', user_count, args.bcrypt_rounds, work_dir)
+    os.environ.update(app_environment(work_dir, database_path, fakes_url, args.bcrypt_rounds))
+    from main import app
+    actors = [Actor(number, user_index, TestClientSession(app), user_count, database_path)
+              for number, user_index in enumerate(actor_users(args.clients, user_count))]
+    return run_scenarios(actors, args.requests, concurrent=False)
+
+
+def wait_for_server(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The benchmark server exited during startup.")
+        try:
+            if requests.get(base_url + '/', timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("The benchmark server did not start in time.")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def run_server(args, user_count, work_dir, fakes_url):
+    database_path = dataset_copy('sqlite', user_count, args.bcrypt_rounds, work_dir)
+    port = free_port()
+    environment = dict(os.environ, **app_environment(work_dir, database_path, fakes_url, args.bcrypt_rounds))
+    environment['PYTHONPATH'] = os.pathsep.join([ROOT, os.path.dirname(ROOT), environment.get('PYTHONPATH', '')])
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'serve.py'), '--port', str(port),
+                                '--workers', str(args.workers)], env=environment, stdout=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_for_server(base_url, process)
+        actors = [Actor(number, user_index, HttpSession(base_url), user_count, database_path)
+                  for number, user_index in enumerate(actor_users(args.clients, user_count))]
+        return run_scenarios(actors, args.requests, concurrent=True)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def run_json(args, user_count, work_dir):
+    """The route scenarios as direct JSONDataManager calls."""
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    from data_manager.json_storage_manager import JSONDataManager
+    path = dataset_copy('json', user_count, args.bcrypt_rounds, work_dir)
+    started_at = time.perf_counter()
+    data_manager = JSONDataManager(path, journaled=args.json_mode == 'journaled', lazy_movies=args.json_lazy)
+    load_seconds = time.perf_counter() - started_at
+    print(f"  loaded in {load_seconds:.2f}s")
+    rng = random.Random(0)
+    added = []
+
+    def random_user():
+        return rng.randrange(user_count)
+
+    def add_movie():
+        movie_id = f'benchmark-{len(added)}'
+        user_id = datasets.user_id(random_user())
+        data_manager.add_movie(user_id, movie_id, 'Benchmark', 7.0, 2000, 'N/A', 'Director', None)
+        added.append((user_id, movie_id))
+
+    def update_movie():
+        index = random_user()
+        movie_id = datasets.movie_id(index, rng.randrange(datasets.MOVIES_PER_USER))
+        data_manager.update_movie(datasets.user_id(index), movie_id, movie_id, 'Updated', 8.5, 2001, 'N/A',
+                                  'Updated Director', None)
+
+    operations = {
+        'login': lambda: data_manager.verify_user(datasets.user_name(random_user()), datasets.PASSWORD),
+        'list_users': lambda: data_manager.get_users_page(datasets.user_name(random_user())),
+        'list_movies': lambda: data_manager.get_user_movies_page(datasets.user_id(random_user())),
+        'add_movie': add_movie,
+        'update_movie': update_movie,
+        'delete_movie': lambda: data_manager.delete_movie(*added.pop()),
+    }
+    results = {'load': {'seconds': round(load_seconds, 3)}}
+    for scenario in SCENARIOS:
+        if scenario not in operations:
+            results[scenario] = {'skipped': 'not supported by the JSON backend'}
+            continue
+        count = min(args.requests, len(added)) if scenario == 'delete_movie' else args.requests
+        latencies, errors = [], 0
+        started_at = time.perf_counter()
+        for _ in range(count):
+            call_started_at = time.perf_counter()
+            try:
+                operations[scenario]()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - call_started_at)
+        results[scenario] = summarize(latencies, errors, time.perf_counter() - started_at)
+        print(f"  {scenario:<14}{json.dumps(results[scenario])}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=datasets.SIZES, default='1k')
+    parser.add_argument('--users', type=int, help="overrides the number of users of --size")
+    parser.add_argument('--backend', nargs='+', choices=['sqlite', 'json'], default=['sqlite', 'json'])
+    parser.add_argument('--mode', nargs='+', choices=['testclient', 'server'], default=['testclient', 'server'],
+                        help="how the SQLite backend is driven")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--clients', type=int, default=8, help="simulated users")
+    parser.add_argument('--workers', type=int, default=4, help="server worker processes")
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--fake-latency', type=float, default=0.0, help="seconds the fake APIs take to answer")
+    parser.add_argument('--json-mode', choices=['journaled', 'snapshot'], default='journaled')
+    parser.add_argument('--json-lazy', action=argparse.BooleanOptionalAction, default=True,
+                        help="defer loading movie lists of the JSON backend")
+    parser.add_argument('-o', '--output', help="result file, defaults to benchmarks/results/<commit>-<size>.json")
+    args = parser.parse_args()
+    user_count = args.users or datasets.SIZES[args.size]
+
+    revision = git_revision()
+    report = {'meta': {**revision, 'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       'python': platform.python_version(), 'platform': platform.platform(),
+                       'cpus': os.cpu_count(), 'users': user_count,
+                       'movies_per_user': datasets.MOVIES_PER_USER, 'requests_per_scenario': args.requests,
+                       'clients': args.clients, 'workers': args.workers, 'bcrypt_rounds': args.bcrypt_rounds,
+                       'fake_latency': args.fake_latency, 'json_mode': args.json_mode,
+                       'json_lazy': args.json_lazy},
+              'runs': []}
+    fakes = start_fake_apis(latency=args.fake_latency)
+    with tempfile.TemporaryDirectory(prefix='moviweb-benchmark-') as work_dir:
+        for mode in args.mode if 'sqlite' in args.backend else []:
+            print(f"sqlite/{mode}, {user_count} users")
+            mode_dir = os.path.join(work_dir, mode)
+            os.makedirs(mode_dir)
+            run = run_server if mode == 'server' else run_testclient
+            report['runs'].append({'backend': 'sqlite', 'mode': mode,
+                                   'results': run(args, user_count, mode_dir, fakes.base_url)})
+        if 'json' in args.backend:
+            print(f"json/direct, {user_count} users")
+            mode_dir = os.path.join(work_dir, 'json')
+            os.makedirs(mode_dir)
+            report['runs'].append({'backend': 'json', 'mode': 'direct',
+                                   'results': run_json(args, user_count, mode_dir)})
+    fakes.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{(revision['commit'] or 'unknown')[:10]}-"
+                                                      f"{args.users or args.size}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
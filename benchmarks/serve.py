@@ -0,0 +1,58 @@
+"""Serves main.app from several pre-forked worker processes sharing one listening socket,
+the way gunicorn would, for the load tests. Configuration comes from the environment.
+
+    python benchmarks/serve.py --port 8000 --workers 4
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+
+def serve_worker(listener):
+    # Imported after the fork so every worker has its own connections and background threads
+    from werkzeug.serving import make_server
+    from main import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No access log
+    server = make_server('127.0.0.1', listener.getsockname()[1], app, threaded=True, fd=listener.fileno())
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', args.port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            serve_worker(listener)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import re
+from sqlalchemy import inspect, text
+from .data_models import CatalogMovie
+
+IMDB_ID_PATTERN = re.compile(r'(tt\d+)')
+CATALOG_COLUMNS = ('title', 'rating', 'year', 'poster', 'director', 'movie_link')
+
+
+def imdb_id_from_link(movie_link):
+    """Extracts the IMDb ID (e.g. tt0944835) from an IMDb title link, or None."""
+    if not movie_link:
+        return None
+    match = IMDB_ID_PATTERN.search(movie_link)
+    return match.group(1) if match else None
+
+
+def catalog_key(movie_link, movie_id):
+    """Returns the catalog key for a movie, falling back to a per-entry key
+    when the IMDb link is missing so the row is still catalogued."""
+    return imdb_id_from_link(movie_link) or f'local:{movie_id}'
+
+
+def _prepare_schema(db):
+    """Creates the catalog table and the movie.imdb_id column if they are missing."""
+    CatalogMovie.__table__.create(bind=db.engine, checkfirst=True)
+    movie_columns = [column['name'] for column in inspect(db.engine).get_columns('movie')]
+    with db.engine.begin() as connection:
+        if 'imdb_id' not in movie_columns:
+            connection.execute(text('ALTER TABLE movie ADD COLUMN imdb_id VARCHAR REFERENCES catalog_movie (imdb_id)'))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_movie_imdb_id ON movie (imdb_id)'))
+
+
+def migrate_movies_to_catalog(db, batch_size=500):
+    """Folds the per-user movie rows into the shared catalog, one batch per transaction.
+    The first row seen for a film seeds its catalog entry; each user's row keeps only
+    the values that differ from the catalog. Returns the number of rows migrated."""
+    _prepare_schema(db)
+    select_batch = text(f'SELECT id, movie_id, {", ".join(CATALOG_COLUMNS)} FROM movie '
+                        'WHERE imdb_id IS NULL ORDER BY id LIMIT :limit')
+    insert_catalog = text(f'INSERT OR IGNORE INTO catalog_movie (imdb_id, {", ".join(CATALOG_COLUMNS)}) '
+                          f'VALUES (:imdb_id, {", ".join(":" + column for column in CATALOG_COLUMNS)})')
+    select_catalog = text(f'SELECT {", ".join(CATALOG_COLUMNS)} FROM catalog_movie WHERE imdb_id = :imdb_id')
+    update_movie = text(f'UPDATE movie SET imdb_id = :imdb_id, '
+                        f'{", ".join(column + " = :" + column for column in CATALOG_COLUMNS)} WHERE id = :id')
+
+    migrated = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(select_batch, {'limit': batch_size}).mappings().all()
+            if not rows:
+                return migrated
+            for row in rows:
+                imdb_id = catalog_key(row['movie_link'], row['movie_id'] or row['id'])
+                connection.execute(insert_catalog, {'imdb_id': imdb_id, **{c: row[c] for c in CATALOG_COLUMNS}})
+                catalog = connection.execute(select_catalog, {'imdb_id': imdb_id}).mappings().first()
+                overrides = {column: None if row[column] == catalog[column] else row[column]
+                             for column in CATALOG_COLUMNS}
+                connection.execute(update_movie, {'id': row['id'], 'imdb_id': imdb_id, **overrides})
+            migrated += len(rows)
@@ -10,24 +10,53 @@ class DataManagerInterface(ABC):
     def get_all_users(self):
         pass
 
+    @abstractmethod
+    def get_users_page(self, after_name=None, limit=50):
+        pass
+
     @abstractmethod
     def get_user_name(self, user_id):
         pass
 
+    @abstractmethod
+    def get_user_by_id(self, user_id):
+        pass
+
+    @abstractmethod
+    def get_user_by_name(self, user_name):
+        pass
+
     @abstractmethod
     def get_user_movies(self, user_id):
         pass
 
+    @abstractmethod
+    def get_user_movie(self, user_id, movie_id):
+        pass
+
+    @abstractmethod
+    def get_user_movies_page(self, user_id, sort='title', cursor=None, limit=24):
+        pass
+
+    @abstractmethod
+    def iter_user_movies(self, user_id, sort='title', batch_size=500):
+        pass
+
     @abstractmethod
     def add_movie(self, user_id, movie_id, title, rating, year, poster, director, movie_link):
         pass
 
+    @abstractmethod
+    def add_movies(self, user_id, movies):
+        pass
+
     @abstractmethod
     def add_user(self, user_name, encrypted_password, user_id, user_movie_list):
         pass
 
     @abstractmethod
-    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link):
+    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link,
+                     version=None):
         pass
 
     @abstractmethod
@@ -45,3 +74,7 @@ class DataManagerInterface(ABC):
     @abstractmethod
     def update_password(self, user_id, new_password):
         pass
+
+    @abstractmethod
+    def verify_user(self, username, password):
+        pass
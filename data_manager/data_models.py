@@ -3,7 +3,7 @@ from moviweb_app.extended.extensions import db
 
 class User(db.Model):
     id = db.Column(db.String, primary_key=True)
-    name = db.Column(db.String(100))
+    name = db.Column(db.String(100), unique=True, index=True)
     password = db.Column(db.String(100))
     email = db.Column(db.String(100))
 
@@ -17,16 +17,81 @@ class User(db.Model):
         return f'name={self.name}'
 
 
-class Movie(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    movie_id = db.Column(db.String)
+class CatalogMovie(db.Model):
+    """A film shared by every user who added it, keyed by its IMDb ID."""
+    imdb_id = db.Column(db.String, primary_key=True)
     title = db.Column(db.String(100))
     rating = db.Column(db.Integer)
     year = db.Column(db.Integer)
     poster = db.Column(db.String(200))
     director = db.Column(db.String(100))
     movie_link = db.Column(db.String(200))
-    user_id = db.Column(db.String, db.ForeignKey('user.id'))
+
+    def __str__(self):
+        return f'imdb_id={self.imdb_id}, title={self.title}'
+
+
+def _catalog_value(name):
+    """Builds a property returning the user's own value for a column if set, else the catalog's."""
+    def getter(self):
+        value = getattr(self, f'_{name}')
+        if value is None and self.catalog is not None:
+            return getattr(self.catalog, name)
+        return value
+    return property(getter)
+
+
+def movie_sort_keys(title, year, rating):
+    """Returns the (sort_title, sort_year, sort_rating) values for a movie. Missing values sort last."""
+    try:
+        sort_year = int(year)
+    except (TypeError, ValueError):
+        sort_year = -1
+    try:
+        sort_rating = float(rating)
+    except (TypeError, ValueError):
+        sort_rating = -1.0
+    return (title or '').lower(), sort_year, sort_rating
+
+
+class Movie(db.Model):
+    """A user's entry for a catalog film. The metadata columns only hold the
+    values a user edited; everything else is read from the shared catalog."""
+    id = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.String, index=True)
+    user_id = db.Column(db.String, db.ForeignKey('user.id'), index=True)
+    imdb_id = db.Column(db.String, db.ForeignKey('catalog_movie.imdb_id'), index=True)
+    _title = db.Column('title', db.String(100))
+    _rating = db.Column('rating', db.Integer)
+    _year = db.Column('year', db.Integer)
+    _poster = db.Column('poster', db.String(200))
+    _director = db.Column('director', db.String(100))
+    _movie_link = db.Column('movie_link', db.String(200))
+    # Effective title, year and rating copied here so the grid can be sorted and paginated from an index
+    sort_title = db.Column(db.String(100))
+    sort_year = db.Column(db.Integer)
+    sort_rating = db.Column(db.Float)
+    # Bumped on every update, so an edit made from a stale page is rejected instead of overwriting
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    catalog = db.relationship('CatalogMovie', lazy='joined')
+
+    __table_args__ = (
+        db.Index('ix_movie_user_sort_title', 'user_id', 'sort_title', 'id'),
+        db.Index('ix_movie_user_sort_year', 'user_id', 'sort_year', 'id'),
+        db.Index('ix_movie_user_sort_rating', 'user_id', 'sort_rating', 'id'),
+    )
+
+    title = _catalog_value('title')
+    rating = _catalog_value('rating')
+    year = _catalog_value('year')
+    poster = _catalog_value('poster')
+    director = _catalog_value('director')
+    movie_link = _catalog_value('movie_link')
+
+    def refresh_sort_keys(self):
+        """Copies the effective title, year and rating into the sort columns."""
+        self.sort_title, self.sort_year, self.sort_rating = movie_sort_keys(self.title, self.year, self.rating)
 
     def __str__(self):
         return f'movie_id={self.movie_id}, title={self.title}'
@@ -34,10 +99,18 @@ class Movie(db.Model):
 
 class Review(db.Model):
     review_id = db.Column(db.String(200), primary_key=True)
-    user_id = db.Column(db.String, db.ForeignKey('user.id'))
-    movie_id = db.Column(db.String, db.ForeignKey('movie.id'))
+    user_id = db.Column(db.String, db.ForeignKey('user.id'), index=True)
+    movie_id = db.Column(db.String, db.ForeignKey('movie.id'), index=True)
     rating = db.Column(db.Integer, db.ForeignKey('movie.rating'))
     likes = db.Column(db.Integer)
     publication_date = db.Column(db.String)
     review_text = db.Column(db.String(500))
     review_title = db.Column(db.String(100))
+
+
+class EntityVersion(db.Model):
+    """A counter per cached entity ('users', 'user:<id>', 'movie:<movie_id>'), bumped in the
+    same transaction as every write that changes what its pages show."""
+    __tablename__ = 'entity_version'
+    key = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
@@ -1,4 +1,7 @@
 import json
+import os
+import re
+import tempfile
 
 
 def create_file(file_path):
@@ -34,13 +37,306 @@ def load_from_file(file_path):
         print(f"File '{file_path}' not found.")
 
 
+def _fsync_directory(directory):
+    """Makes a rename in the directory durable. Not possible on Windows, where it is skipped."""
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
 def save_file(file_path, data):
     """
     Saves the given product dict to the file, overwriting what's in the file.
+    The data is written to a temporary file first and renamed over the original,
+    so a crash mid-write never leaves a truncated file behind. Raises if the file
+    could not be written, leaving the original in place.
     """
+    temp_path = None
     try:
-        with open(file_path, 'w') as file:
+        directory = os.path.dirname(os.path.abspath(file_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as file:
+            temp_path = file.name
             json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+        _fsync_directory(directory)
     except Exception as e:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         print(f"An error occurred while saving JSON data to '{file_path}'.")
         print(f"Error message: {str(e)}")
+        raise
+
+
+def append_records(file_path, records):
+    """Appends records to a journal file, one compact JSON document per line, and syncs it to disk."""
+    with open(file_path, 'a') as file:
+        for record in records:
+            file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def load_records(file_path, offset=0):
+    """Yields the records of a journal file, starting at the given byte offset.
+    A torn last line left by a crash is ignored."""
+    try:
+        with open(file_path, 'r') as file:
+            file.seek(offset)
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping an incomplete record in '{file_path}'.")
+                    return
+    except FileNotFoundError:
+        return
+
+
+def clear_records(file_path):
+    """Empties a journal file once its records are part of a snapshot."""
+    with open(file_path, 'w') as file:
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# A complete string, a bracket, or the opening quote of a string that runs past the text
+_JSON_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]|"', re.DOTALL)
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+class _ValueScanner:
+    """Finds where a JSON container or string ends, fed one piece of text at a time.
+    The state carries over between pieces, so each piece is scanned only once."""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def _continue_string(self, text, index):
+        """Marks a string running past the end of text, noting whether its last character escapes the next."""
+        rest = text[index:]
+        self.in_string = True
+        self.escaped = (len(rest) - len(rest.rstrip('\\'))) % 2 == 1
+
+    def scan(self, text):
+        """Returns the index just past the end of the value in text, or None if it continues."""
+        index = 0
+        if self.in_string:
+            index = 1 if self.escaped else 0
+            if index > len(text):
+                return None
+            string = _STRING_REST.match(text, index)
+            if string is None:
+                self._continue_string(text, index)
+                return None
+            self.in_string = False
+            index = string.end()
+            if self.depth == 0:
+                return index
+        for match in _JSON_TOKENS.finditer(text, index):
+            token = match.group()
+            if token == '"':
+                self._continue_string(text, match.end())
+                return None
+            if token[0] == '"':
+                if self.depth == 0:
+                    return match.end()
+            elif token in '{[':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return match.end()
+        return None
+
+
+class _StreamReader:
+    """Reads a JSON file in chunks, keeping only the undecoded tail in memory and
+    tracking the byte offset of the buffer start so positions can be sought later.
+    The handle must be opened with newline='' so the text matches the bytes on disk."""
+
+    def __init__(self, handle, chunk_size):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0  # index into buffer
+        self.buffer_offset = 0  # byte offset of buffer[0] in the file
+        self.eof = False
+        self._measured = (0, 0)  # (index, its byte offset from the buffer start), to avoid re-encoding
+
+    def fill(self):
+        """Reads another chunk, dropping the part of the buffer already consumed."""
+        self.buffer_offset = self.byte_offset(self.position)
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        self._measured = (0, 0)
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer += chunk
+
+    def byte_offset(self, index):
+        measured_index, measured_bytes = self._measured
+        if index < measured_index:
+            measured_index, measured_bytes = 0, 0
+        measured_bytes += len(self.buffer[measured_index:index].encode('utf-8'))
+        self._measured = (index, measured_bytes)
+        return self.buffer_offset + measured_bytes
+
+    def skip_whitespace(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return
+            self.fill()
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buffer[self.position] if self.position < len(self.buffer) else ''
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' at byte {self.byte_offset(self.position)}")
+        self.position += 1
+
+    def decode_value(self, decoder, with_span=False):
+        """Decodes the next JSON value, reading more chunks until it is complete.
+        Returns the value and, if asked for, its (start, end) byte span in the file."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                if self.buffer[self.position] in '{["':
+                    return self._decode_long_value(decoder, with_span)
+                self.fill()
+                continue
+            if not self.eof and self.buffer[self.position] not in '{["' and \
+                    (end == len(self.buffer) or self.buffer[end] not in ' \t\r\n,]}'):
+                # A number may continue in the next chunk: '7.' could be the start of '7.5'
+                self.fill()
+                continue
+            span = (self.byte_offset(self.position), self.byte_offset(end)) if with_span else None
+            self.position = end
+            return value, span
+
+    def _decode_long_value(self, decoder, with_span):
+        """Decodes a container or string that runs past the buffer. The chunks are scanned
+        for its end as they are read and joined once, instead of decoding the growing
+        buffer again after every chunk."""
+        start = self.byte_offset(self.position)
+        scanner = _ValueScanner()
+        pieces = []
+        text = self.buffer[self.position:]
+        end = scanner.scan(text)
+        while end is None:
+            pieces.append(text)
+            text = self.handle.read(self.chunk_size)
+            if not text:
+                self.eof = True
+                break
+            end = scanner.scan(text)
+        if end is None:
+            end = len(text)
+        pieces.append(text[:end])
+        value_text = ''.join(pieces)
+        value = decoder.decode(value_text)
+        self.buffer_offset = start + len(value_text.encode('utf-8'))
+        self.buffer = text[end:]
+        self.position = 0
+        self._measured = (0, 0)
+        return value, (start, self.buffer_offset) if with_span else None
+
+
+def iter_users(file_path, defer_movies=False, chunk_size=1 << 16):
+    """Parses a movies.json file one user at a time, so memory use is bounded by the
+    largest single user rather than the whole file. Yields (user, movies_span) pairs.
+    With defer_movies, the 'movies' list is left out of the user dict and movies_span
+    is the (start, end) byte range of that list in the file, to be read with read_span."""
+    initialize(file_path)
+    decoder = json.JSONDecoder()
+    # No newline translation, so the recorded spans are byte offsets of the file on disk
+    with open(file_path, 'r', encoding='utf-8', newline='') as handle:
+        reader = _StreamReader(handle, chunk_size)
+        reader.expect('[')
+        if reader.peek() == ']':
+            return
+        while True:
+            reader.expect('{')
+            user, movies_span = {}, None
+            while reader.peek() != '}':
+                key, _ = reader.decode_value(decoder)
+                reader.expect(':')
+                deferred = key == 'movies' and defer_movies
+                value, span = reader.decode_value(decoder, with_span=deferred)
+                if deferred:
+                    movies_span = span
+                else:
+                    user[key] = value
+                if reader.peek() == ',':
+                    reader.position += 1
+            reader.position += 1
+            yield user, movies_span
+            if reader.peek() == ',':
+                reader.position += 1
+            else:
+                reader.expect(']')
+                return
+
+
+def read_span(handle, span):
+    """Reads and decodes the JSON value stored at a byte span recorded by iter_users,
+    from a binary handle opened on the file that was parsed."""
+    start, end = span
+    handle.seek(start)
+    return json.loads(handle.read(end - start).decode('utf-8'))
+
+
+def save_users_file(file_path, users, movie_spans, source):
+    """Atomically writes the users to the file like save_file, but copies the movie lists
+    that were never loaded (listed in movie_spans by user ID) straight from the source
+    handle instead of holding them in memory. Returns the new spans of those lists."""
+    new_spans = {}
+    directory = os.path.dirname(os.path.abspath(file_path))
+    temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False) as target:
+            temp_path = target.name
+            target.write(b'[')
+            for index, user in enumerate(users):
+                if index:
+                    target.write(b', ')
+                span = movie_spans.get(user['id'])
+                if span is None:
+                    target.write(json.dumps(user).encode('utf-8'))
+                    continue
+                target.write(json.dumps(user)[:-1].encode('utf-8'))
+                target.write(b', "movies": ' if user else b'"movies": ')
+                source.seek(span[0])
+                start = target.tell()
+                target.write(source.read(span[1] - span[0]))
+                new_spans[user['id']] = (start, target.tell())
+                target.write(b'}')
+            target.write(b']')
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temp_path, file_path)
+        _fsync_directory(directory)
+        return new_spans
+    except Exception:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
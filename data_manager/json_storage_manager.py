@@ -1,20 +1,291 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
 from .data_manager_interface import DataManagerInterface
-from .file_handler import load_from_file, save_file
-from moviweb_app.extended.id_password_handler import check_password_hash
+from .file_handler import initialize, save_file, append_records, load_records, clear_records, iter_users, \
+    read_span, save_users_file
+from .pagination import MOVIE_SORTS, encode_cursor, decode_cursor
+from moviweb_app.extended.id_password_handler import check_password_hash, generate_password_hash, \
+    password_needs_rehash
+from moviweb_app.extended.login_handler import user_cache
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where only a single process is supported
+    fcntl = None
 
 
 class JSONDataManager(DataManagerInterface):
-    """Initializes the JSONDataManager object with the specified data file."""
-    def __init__(self, filename):
+    """Initializes the JSONDataManager object with the specified data file.
+
+    Every mutation is described by a record that is applied to the in-memory data.
+    By default the whole file is then rewritten; in journaled mode the record is
+    appended to '<filename>.journal' instead, replayed on load, and a background
+    thread periodically folds the journal into a new snapshot of the file.
+
+    Users are indexed by ID and by name, and movies by (user ID, movie ID), so
+    lookups don't scan the data. The indexes are kept in step by _apply.
+
+    The file is parsed one user at a time. With lazy_movies, each user's movie list
+    is left on disk and only its byte span is kept until the list is first needed,
+    so memory holds the user records plus the movie lists actually in use.
+
+    Several processes may share the file: writes hold an exclusive flock on
+    '<filename>.lock', and before reading or writing each process checks whether
+    the file or the journal changed since it last looked. A new snapshot is
+    reloaded; new journal records are replayed on top of the data it has."""
+    def __init__(self, filename, journaled=False, compact_interval=60, compact_threshold=1000, lazy_movies=False):
         self.filename = filename
-        self.data = load_from_file(filename)
+        self.journaled = journaled
+        self.journal_filename = f'{filename}.journal'
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self.lazy_movies = lazy_movies
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = open(f'{filename}.lock', 'a')
+        self._snapshot = None
+        self._snapshot_state = None
+        initialize(filename)
+        with self._locked(exclusive=False):
+            self._load()
+        if journaled:
+            threading.Thread(target=self._compact_periodically, name='json-compaction', daemon=True).start()
 
     def __str__(self):
         """Returns a string representation of the JSONDataManager object."""
         return f'{self.data}'
 
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Holds the thread lock and the file lock shared by all processes. Nested
+        calls reuse the file lock taken by the outermost one."""
+        with self._lock:
+            if self._lock_depth or fcntl is None:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_state(path):
+        """Identifies the current version of a file. A new snapshot replaces the file, so its inode changes."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _journal_length(self):
+        try:
+            return os.path.getsize(self.journal_filename)
+        except FileNotFoundError:
+            return 0
+
+    def _load(self):
+        """Reads the snapshot and the journal. Must be called holding the file lock.
+
+        Threads reading without the lock keep seeing the previous data until the new
+        data and indexes are complete; each is then swapped in with one assignment.
+        The snapshot state is recorded last, so until the load is finished _changed()
+        stays true and other threads wait for the lock instead of reading."""
+        # Deferred movie lists are read through this handle, which keeps pointing at the
+        # parsed file even after another process replaces it
+        snapshot = open(self.filename, 'rb')
+        snapshot_state = self._file_state(self.filename)
+        data = []
+        movie_spans = {}
+        for user, movies_span in iter_users(self.filename, defer_movies=self.lazy_movies):
+            data.append(user)
+            if movies_span is not None:
+                movie_spans[user['id']] = movies_span
+        users_by_id, users_by_name, movies, sorted_names = self._build_indexes(data)
+
+        previous_snapshot, self._snapshot = self._snapshot, snapshot
+        self.data = data
+        self._movie_spans = movie_spans
+        self._users_by_id = users_by_id
+        self._users_by_name = users_by_name
+        self._movies = movies
+        self._sorted_names = sorted_names
+        if previous_snapshot is not None:
+            previous_snapshot.close()
+        self._journal_size = 0
+        self._journal_offset = 0
+        if self.journaled:
+            self._replay_journal()
+        self._snapshot_state = snapshot_state
+
+    def _replay_journal(self):
+        """Applies the journal records written since the last replay."""
+        length = self._journal_length()
+        for record in load_records(self.journal_filename, self._journal_offset):
+            self._apply(record)
+            self._journal_size += 1
+        self._journal_offset = length
+
+    def _changed(self):
+        if self._file_state(self.filename) != self._snapshot_state:
+            return True
+        return self.journaled and self._journal_length() != self._journal_offset
+
+    def _sync(self):
+        """Catches up with changes made by other processes. Must be called holding the file lock."""
+        if self._file_state(self.filename) != self._snapshot_state:
+            self._load()
+        elif self.journaled and self._journal_length() != self._journal_offset:
+            if self._journal_length() < self._journal_offset:
+                self._load()
+            else:
+                self._replay_journal()
+
+    def _refresh(self):
+        """Brings the data up to date before a read; a stat call when nothing changed."""
+        if self._changed():
+            with self._locked(exclusive=False):
+                self._sync()
+
+    @staticmethod
+    def _build_indexes(data):
+        """Builds the lookup dicts and the sorted name list for the users in data."""
+        users_by_id = {}
+        users_by_name = {}
+        movies = {}
+        for user in data:
+            JSONDataManager._index_into(user, users_by_id, users_by_name, movies)
+        return users_by_id, users_by_name, movies, sorted(users_by_name)
+
+    @staticmethod
+    def _index_into(user, users_by_id, users_by_name, movies):
+        users_by_id[user['id']] = user
+        if user.get('name') is not None:
+            users_by_name[user['name']] = user
+        for movie in user.get('movies') or []:
+            movies[(user['id'], movie['id'])] = movie
+
+    def _index_user(self, user):
+        self._index_into(user, self._users_by_id, self._users_by_name, self._movies)
+
+    def _find_user(self, user_id):
+        return self._users_by_id.get(user_id)
+
+    def _load_movies(self, user):
+        """Reads the user's movie list from the file if it was deferred at load time."""
+        with self._lock:
+            span = self._movie_spans.get(user['id'])
+            if span is None:
+                return
+            user['movies'] = read_span(self._snapshot, span)
+            del self._movie_spans[user['id']]
+            for movie in user['movies']:
+                self._movies[(user['id'], movie['id'])] = movie
+
+    def _save_snapshot(self):
+        """Rewrites the file from the in-memory data. Must be called holding the exclusive file lock.
+        Raises if the new file could not be written and renamed into place."""
+        if self._movie_spans:
+            self._movie_spans = save_users_file(self.filename, self.data, self._movie_spans, self._snapshot)
+        else:
+            save_file(self.filename, self.data)
+        self._snapshot.close()
+        self._snapshot = open(self.filename, 'rb')
+        self._snapshot_state = self._file_state(self.filename)
+
+    def _apply(self, record):
+        """Applies a mutation record to the in-memory data. Applying a record twice
+        has no further effect, so replaying a journal after a crash is safe."""
+        op = record['op']
+        if op == 'add_user':
+            user = record['user']
+            if self._find_user(user['id']) is None:
+                self.data.append(user)
+                self._index_user(user)
+                if user.get('name') is not None:
+                    bisect.insort(self._sorted_names, user['name'])
+            return
+        user = self._find_user(record['user_id'])
+        if user is None:
+            return
+        if op in ('add_movies', 'update_movie', 'delete_movie'):
+            self._load_movies(user)
+        if op == 'add_movies':
+            movies = user.setdefault('movies', [])
+            for movie in record['movies']:
+                key = (user['id'], movie['id'])
+                if key not in self._movies:
+                    movies.append(movie)
+                    self._movies[key] = movie
+        elif op == 'update_movie':
+            movie = self._movies.get((user['id'], record['movie_id']))
+            if movie is not None:
+                movie.update(record['fields'])
+        elif op == 'delete_movie':
+            movie = self._movies.pop((user['id'], record['movie_id']), None)
+            if movie is not None:
+                user['movies'].remove(movie)
+        elif op == 'delete_user':
+            self.data.remove(user)
+            del self._users_by_id[user['id']]
+            self._movie_spans.pop(user['id'], None)
+            for movie in user.get('movies') or []:
+                self._movies.pop((user['id'], movie['id']), None)
+            if self._users_by_name.get(user.get('name')) is user:
+                del self._users_by_name[user['name']]
+                self._sorted_names.pop(bisect.bisect_left(self._sorted_names, user['name']))
+        elif op == 'update_password':
+            user['password'] = record['password']
+
+    def _commit(self, record):
+        """Applies a mutation record on top of the latest data and persists it."""
+        with self._locked():
+            self._sync()
+            self._apply(record)
+            if self.journaled:
+                append_records(self.journal_filename, [record])
+                self._journal_size += 1
+                self._journal_offset = self._journal_length()
+            else:
+                self._save_snapshot()
+
+    def compact(self):
+        """Writes the current data as a new snapshot and empties the journal. The journal is
+        only emptied once the snapshot is safely on disk; if writing it fails, the error is
+        raised and the journal kept, so no record is lost."""
+        with self._locked():
+            self._sync()
+            if self._journal_size == 0:
+                return
+            self._save_snapshot()
+            clear_records(self.journal_filename)
+            self._journal_size = 0
+            self._journal_offset = 0
+
+    def _compact_periodically(self):
+        last_compaction = time.monotonic()
+        while True:
+            time.sleep(1)
+            interval_passed = time.monotonic() - last_compaction >= self.compact_interval
+            if interval_passed or self._journal_size >= self.compact_threshold:
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error while compacting '{self.journal_filename}': {str(e)}")
+                last_compaction = time.monotonic()
+
     def get_all_users(self):
         """Retrieves a list of all users in the data."""
+        self._refresh()
         try:
             users = [user['name'] for user in self.data]
             if users:
@@ -24,21 +295,88 @@ class JSONDataManager(DataManagerInterface):
         except Exception as e:
             raise RuntimeError("An error occurred while retrieving user data.") from e
 
+    def get_user_by_id(self, user_id):
+        """Retrieves the name, password and ID of the user with the provided user ID."""
+        self._refresh()
+        user = self._find_user(user_id)
+        if user:
+            return {'name': user['name'], 'password': user['password'], 'id': user['id']}
+        return None
+
+    def get_user_by_name(self, user_name):
+        """Retrieves the name, password and ID of the user with the provided user name."""
+        self._refresh()
+        user = self._users_by_name.get(user_name)
+        if user:
+            return {'name': user['name'], 'password': user['password'], 'id': user['id']}
+        return None
+
+    def get_users_page(self, after_name=None, limit=50):
+        """Retrieves the ID and name of up to `limit` users ordered by name, starting after the given name."""
+        self._refresh()
+        start = 0 if after_name is None else bisect.bisect_right(self._sorted_names, after_name)
+        users = (self._users_by_name[name] for name in self._sorted_names[start:start + limit])
+        return [{'id': user['id'], 'name': user['name']} for user in users]
+
     def get_user_movies(self, user_id):
         """Retrieves the list of movies associated with the provided user ID."""
         try:
-            user_movies = next((user.get('movies') for user in self.data if user['id'] == user_id), None)
-            return user_movies
+            with self._lock:
+                self._refresh()
+                user = self._find_user(user_id)
+                if user is None:
+                    return None
+                self._load_movies(user)
+                return user.get('movies')
         except StopIteration:
             raise TypeError(f"Error finding the user with id {user_id}")
         except Exception as e:
             raise RuntimeError("An error occurred while retrieving user movies.") from e
 
+    def get_user_movie(self, user_id, movie_id):
+        """Retrieves one movie from the movie list of the user with the provided user ID, or None."""
+        self._refresh()
+        with self._lock:
+            if user_id in self._movie_spans:
+                self._load_movies(self._find_user(user_id))
+            return self._movies.get((user_id, movie_id))
+
+    def get_user_movies_page(self, user_id, sort='title', cursor=None, limit=24):
+        """Retrieves one page of the user's movies and the cursor of the next page (None on the last one)."""
+        sort_key, descending = MOVIE_SORTS.get(sort, MOVIE_SORTS['title'])
+
+        def position(movie):
+            if sort_key == 'sort_title':
+                value = (movie.get('title') or '').lower()
+            else:
+                value = movie.get(sort_key[len('sort_'):])
+                value = value if isinstance(value, (int, float)) else -1
+            return value, movie['id']
+
+        movies = sorted(self.get_user_movies(user_id) or [], key=position, reverse=descending)
+        if cursor:
+            last_position = tuple(decode_cursor(cursor))
+            movies = [movie for movie in movies
+                      if (position(movie) < last_position if descending else position(movie) > last_position)]
+        if len(movies) <= limit:
+            return movies, None
+        return movies[:limit], encode_cursor(*position(movies[limit - 1]))
+
+    def iter_user_movies(self, user_id, sort='title', batch_size=500):
+        """Yields all of the user's movies in the requested order."""
+        cursor = None
+        while True:
+            movies, cursor = self.get_user_movies_page(user_id, sort, cursor, batch_size)
+            yield from movies
+            if cursor is None:
+                return
+
     def get_user_name(self, user_id):
         """Retrieves the name of a user based on the provided user ID."""
+        self._refresh()
         try:
-            user_name = next((user.get('name') for user in self.data if user['id'] == user_id), None)
-            return user_name
+            user = self._find_user(user_id)
+            return user.get('name') if user else None
         except StopIteration:
             raise TypeError(f"Error finding the user with id {user_id}")
         except Exception as e:
@@ -47,75 +385,76 @@ class JSONDataManager(DataManagerInterface):
     def add_user(self, user_name, encrypted_password, user_id, user_movie_list):
         """Adds a new user with the given name, ID, and movie list to the data."""
         try:
-            existing_user = next((user for user in self.data if user['name'] == user_name), None)
-            if existing_user:
-                # User with the same name already exists
-                return False
+            with self._locked():
+                self._sync()
+                if user_name in self._users_by_name:
+                    # User with the same name already exists
+                    return False
 
-            new_user = {'id': user_id, 'name': user_name, 'password': encrypted_password, 'movies': user_movie_list}
-            self.data.append(new_user)
-            save_file(self.filename, self.data)
-            return True  # User added successfully
+                new_user = {'id': user_id, 'name': user_name, 'password': encrypted_password,
+                            'movies': user_movie_list if isinstance(user_movie_list, list) else []}
+                self._commit({'op': 'add_user', 'user': new_user})
+                return True  # User added successfully
         except Exception as e:
             raise RuntimeError("An error occurred while adding a new user.") from e
 
     def add_movie(self, user_id, movie_id, title, rating, year, poster, director, movie_link):
         """Adds a new movie to the movie list of the user with the provided user ID."""
+        self._refresh()
         try:
-            user = next((user for user in self.data if user['id'] == user_id), None)
+            user = self._find_user(user_id)
             if user:
                 new_movie = {'id': movie_id, 'title': title, 'director': director, 'year': year,
                              'rating': rating, 'poster': poster, 'movie_link': movie_link}
-
-                if 'movies' not in user:
-                    user['movies'] = [new_movie]
-                else:
-                    user['movies'].append(new_movie)
-
-                save_file(self.filename, self.data)
+                self._commit({'op': 'add_movies', 'user_id': user_id, 'movies': [new_movie]})
         except StopIteration:
             raise ValueError(f"User with ID {user_id} not found.")
         except Exception as e:
             raise RuntimeError("An error occurred while adding a new movie.") from e
 
-    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link):
-        """Updates the details of a movie identified by the user ID and movie ID."""
+    def add_movies(self, user_id, movies):
+        """Adds a batch of movies to the movie list of the user with the provided user ID, saving the file once."""
+        self._refresh()
         try:
-            movie_to_update = None
-            user_movies = self.get_user_movies(user_id)
-            for movie in user_movies:
-                if movie['id'] == movie_id:
-                    movie_to_update = movie
-                    break
-
-            if movie_to_update:
-                movie_to_update['title'] = title
-                movie_to_update['rating'] = rating
-                movie_to_update['year'] = year
-                movie_to_update['poster'] = poster
-                movie_to_update['director'] = director
-                movie_to_update['movie_link'] = movie_link
-                save_file(self.filename, self.data)
-                return movie_to_update
-            else:
-                raise ValueError(f"Movie with ID {movie_id} not found.")
+            user = self._find_user(user_id)
+            if user is None:
+                raise ValueError(f"User with ID {user_id} not found.")
+            new_movies = [{'id': movie['movie_id'], 'title': movie['title'], 'director': movie['director'],
+                           'year': movie['year'], 'rating': movie['rating'], 'poster': movie['poster'],
+                           'movie_link': movie['movie_link']} for movie in movies]
+            self._commit({'op': 'add_movies', 'user_id': user_id, 'movies': new_movies})
+            return len(movies)
+        except Exception as e:
+            raise RuntimeError("An error occurred while adding movies.") from e
+
+    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link,
+                     version=None):
+        """Updates the details of a movie identified by the user ID and movie ID.
+        If a version is given, returns None without writing if the movie changed since."""
+        try:
+            with self._locked():
+                self._sync()
+                movie_to_update = self.get_user_movie(user_id, movie_id)
+                if movie_to_update and version is not None and movie_to_update.get('version', 1) != version:
+                    return None
+
+                if movie_to_update:
+                    fields = {'title': title, 'rating': rating, 'year': year, 'poster': poster,
+                              'director': director, 'movie_link': movie_link,
+                              'version': movie_to_update.get('version', 1) + 1}
+                    self._commit({'op': 'update_movie', 'user_id': user_id, 'movie_id': movie_id, 'fields': fields})
+                    return movie_to_update
+                else:
+                    raise ValueError(f"Movie with ID {movie_id} not found.")
         except Exception as e:
             raise RuntimeError("An error occurred while updating the movie.") from e
 
     def delete_movie(self, user_id, movie_id):
         """Deletes a movie with the specified movie ID from the user's movie list."""
+        self._refresh()
         try:
-            movie_to_delete = None
-            user_movies = self.get_user_movies(user_id)
-
-            for movie in user_movies:
-                if movie['id'] == movie_id:
-                    movie_to_delete = movie
-                    break
-
-            if movie_to_delete:
-                user_movies.remove(movie_to_delete)
-                save_file(self.filename, self.data)
+            if self.get_user_movie(user_id, movie_id):
+                self._commit({'op': 'delete_movie', 'user_id': user_id, 'movie_id': movie_id})
             else:
                 raise ValueError(f"Movie with ID {movie_id} not found.")
         except Exception as e:
@@ -123,20 +462,16 @@ class JSONDataManager(DataManagerInterface):
 
     def delete_user(self, user_id):
         """Delete a user with the provided user ID from the data."""
-        user_to_delete = None
-        for user in self.data:
-            if user['id'] == user_id:
-                user_to_delete = user
-                break
-
-        if user_to_delete:
-            self.data.remove(user_to_delete)
-            save_file(self.filename, self.data)
+        self._refresh()
+        if self._find_user(user_id):
+            self._commit({'op': 'delete_user', 'user_id': user_id})
+            user_cache.invalidate(user_id)
         else:
             raise ValueError(f"User with ID {user_id} not found.")
 
     def get_user_data(self):
         """Retrieves user data from the data manager."""
+        self._refresh()
         users_data = []
         for user in self.data:
             username = user['name']
@@ -147,16 +482,20 @@ class JSONDataManager(DataManagerInterface):
 
     def update_password(self, user_id, new_password):
         """Updates the password of a user."""
-        try:
-            user = next(user for user in self.data if user['id'] == user_id)
-            user['password'] = new_password
-        except StopIteration:
+        self._refresh()
+        if self._find_user(user_id) is None:
             raise TypeError(f"Error finding the user with id {user_id}")
+        self._commit({'op': 'update_password', 'user_id': user_id, 'password': new_password})
+        user_cache.invalidate(user_id)
 
     def verify_user(self, username, password):
-        user = next((user for user in self.data if user["name"] == username), None)
+        """Returns the user's data if the password matches the stored hash, otherwise None."""
+        user = self.get_user_by_name(username)
 
         if user and check_password_hash(user["password"], password):
+            if password_needs_rehash(user["password"]):
+                # The work factor changed since this hash was made, upgrade it transparently
+                self.update_password(user['id'], generate_password_hash(password))
             return user
         else:
             return None
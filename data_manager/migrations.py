@@ -0,0 +1,183 @@
+from sqlalchemy import delete, exists, inspect, literal, select, text, tuple_, update
+from .catalog_migration import migrate_movies_to_catalog
+from .data_models import EntityVersion, Movie, Review, User
+
+
+class MigrationError(RuntimeError):
+    """Raised when a migration can't be applied until the data is fixed by hand."""
+
+
+def find_duplicate_user_names(db):
+    """Returns {name: [user IDs]} for every name shared by more than one user."""
+    with db.engine.connect() as connection:
+        rows = connection.execute(text('SELECT name, id FROM user WHERE name IN '
+                                       '(SELECT name FROM user GROUP BY name HAVING COUNT(*) > 1) '
+                                       'ORDER BY name, id')).all()
+    duplicates = {}
+    for name, user_id in rows:
+        duplicates.setdefault(name, []).append(user_id)
+    return duplicates
+
+
+def _add_secondary_indexes(db):
+    """Adds the indexes behind the hot lookups of SQLiteDataManager. User names were never
+    checked for uniqueness before, so duplicates are reported before any index is built."""
+    duplicates = find_duplicate_user_names(db)
+    if duplicates:
+        listing = '\n'.join(f"  {name!r}: user IDs {', '.join(user_ids)}" for name, user_ids in duplicates.items())
+        raise MigrationError(
+            f"User names must be unique from now on, but these are shared by several users:\n{listing}\n"
+            f"Rename all but one user of each name, e.g. "
+            f"UPDATE user SET name = '<new name>' WHERE id = '<user ID>', then run the migration again. "
+            f"Renamed users log in with their new name.")
+    statements = [
+        'CREATE INDEX IF NOT EXISTS ix_movie_user_id ON movie (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_movie_movie_id ON movie (movie_id)',
+        'CREATE INDEX IF NOT EXISTS ix_review_movie_id ON review (movie_id)',
+        'CREATE INDEX IF NOT EXISTS ix_review_user_id ON review (user_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_user_name ON user (name)',
+    ]
+    # Each index is built in its own short transaction so readers are only briefly held up
+    for statement in statements:
+        with db.engine.begin() as connection:
+            connection.execute(text(statement))
+
+
+def _add_movie_sort_keys(db, batch_size=500):
+    """Adds and backfills the movie sort columns, then builds the per-user sort indexes."""
+    movie_columns = [column['name'] for column in inspect(db.engine).get_columns('movie')]
+    with db.engine.begin() as connection:
+        for column, column_type in (('sort_title', 'VARCHAR(100)'), ('sort_year', 'INTEGER'),
+                                    ('sort_rating', 'FLOAT')):
+            if column not in movie_columns:
+                connection.execute(text(f'ALTER TABLE movie ADD COLUMN {column} {column_type}'))
+
+    def catalog_value(column):
+        return f'(SELECT {column} FROM catalog_movie WHERE catalog_movie.imdb_id = movie.imdb_id)'
+
+    backfill = text(f"UPDATE movie SET "
+                    f"sort_title = lower(COALESCE(title, {catalog_value('title')}, '')), "
+                    f"sort_year = COALESCE(year, {catalog_value('year')}, -1), "
+                    f"sort_rating = COALESCE(rating, {catalog_value('rating')}, -1.0) "
+                    f"WHERE id IN (SELECT id FROM movie WHERE sort_title IS NULL LIMIT :limit)")
+    while True:
+        with db.engine.begin() as connection:
+            if connection.execute(backfill, {'limit': batch_size}).rowcount == 0:
+                break
+
+    for sort_column in ('sort_title', 'sort_year', 'sort_rating'):
+        with db.engine.begin() as connection:
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS ix_movie_user_{sort_column} '
+                                    f'ON movie (user_id, {sort_column}, id)'))
+
+
+def _add_movie_version(db):
+    """Adds the optimistic concurrency version column to movie."""
+    movie_columns = [column['name'] for column in inspect(db.engine).get_columns('movie')]
+    if 'version' not in movie_columns:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE movie ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+
+def _add_entity_versions(db):
+    """Creates the version counters behind conditional GETs and the fragment cache."""
+    EntityVersion.__table__.create(db.engine, checkfirst=True)
+
+
+# Ordered list of (version, description, migration function). Append only.
+MIGRATIONS = [
+    (1, 'Fold per-user movie rows into the shared catalog', migrate_movies_to_catalog),
+    (2, 'Add secondary indexes on movie, review and user', _add_secondary_indexes),
+    (3, 'Add indexed sort keys for the paginated movie grid', _add_movie_sort_keys),
+    (4, 'Add a version column to movie for optimistic concurrency', _add_movie_version),
+    (5, 'Add entity version counters for HTTP caching', _add_entity_versions),
+]
+
+
+def get_schema_version(db):
+    """Returns the schema version recorded in the database file."""
+    with db.engine.connect() as connection:
+        return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def _set_schema_version(db, version):
+    with db.engine.begin() as connection:
+        connection.execute(text(f'PRAGMA user_version = {int(version)}'))
+
+
+def pending_migrations(db):
+    """Returns the migrations that have not been applied to the database yet."""
+    current_version = get_schema_version(db)
+    return [migration for migration in MIGRATIONS if migration[0] > current_version]
+
+
+def migrate(db):
+    """Applies every pending migration in order and returns the versions applied.
+    WAL journaling is switched on first so the app can keep reading while it runs."""
+    with db.engine.connect() as connection:
+        connection.execute(text('PRAGMA journal_mode=WAL'))
+    # Creates missing tables only, existing ones are left to the migrations below
+    User.metadata.create_all(bind=db.engine)
+    applied = []
+    for version, description, migration in pending_migrations(db):
+        print(f"Applying migration {version}: {description}")
+        migration(db)
+        _set_schema_version(db, version)
+        applied.append(version)
+    return applied
+
+
+def _hot_queries():
+    """The statements SQLiteDataManager runs on every request, with sample parameters. The
+    WHERE clauses follow the manager's; tests/test_query_plans.py checks the statements the
+    manager actually sends."""
+    reviews_by_movie = (Review.movie_id == 'movie-id')
+    return {
+        'get_user_by_id': select(User).where(User.id == 'user-id'),
+        'get_user_by_name': select(User).where(User.name == 'user-name'),
+        'get_users_page': select(User.id, User.name).where(User.name.isnot(None), User.name > 'user-name')
+        .order_by(User.name).limit(51),
+        'get_user_movies': select(Movie).where(Movie.user_id == 'user-id'),
+        'get_user_movie': select(Movie).where(Movie.user_id == 'user-id', Movie.movie_id == 'movie-id'),
+        'get_user_movies_page': select(Movie).where((Movie.user_id == 'user-id') & (
+            tuple_(Movie.sort_year, Movie.id) < (2000, 10))).order_by(Movie.sort_year.desc(), Movie.id.desc()).limit(25),
+        'update_movie': update(Movie.__table__).where(Movie.__table__.c.user_id == 'user-id',
+                                                      Movie.__table__.c.movie_id == 'movie-id',
+                                                      Movie.__table__.c.version == 1)
+        .values(version=Movie.__table__.c.version + 1),
+        'delete_movie': select(Movie).where(Movie.user_id == 'user-id', Movie.id == 1),
+        'get_movie_details': select(Movie).where(Movie.movie_id == 'movie-id'),
+        'get_movie_with_reviews': select(Movie, Review, User.name)
+        .outerjoin(Review, Review.movie_id == Movie.movie_id).outerjoin(User, User.id == Review.user_id)
+        .where(Movie.movie_id == 'movie-id').order_by(Review.likes.desc(), Review.review_id).limit(21),
+        'add_reviews': select(literal('review-id')).where(exists().where(Movie.movie_id == 'movie-id'))
+        .where(exists().where(User.id == 'user-id')),
+        'edit_reviews': update(Review).where(Review.review_id == 'review-id', Review.user_id == 'user-id',
+                                             reviews_by_movie).values(rating=5),
+        'delete_reviews': delete(Review).where(Review.review_id == 'review-id', Review.user_id == 'user-id',
+                                               reviews_by_movie),
+        'get_review_info': select(Review).where(Review.review_id == 'review-id'),
+        'get_all_movie_reviews': select(Review).where(reviews_by_movie),
+    }
+
+
+def _reads_table(detail):
+    """Whether a plan step scans a whole table. VALUES lists and SELECTs without FROM scan constant rows."""
+    return detail.startswith('SCAN') and 'CONSTANT ROW' not in detail
+
+
+def explain_query_plans(db, queries=None):
+    """Runs EXPLAIN QUERY PLAN for each query and returns {name: [plan details]}."""
+    plans = {}
+    with db.engine.connect() as connection:
+        for name, query in (queries or _hot_queries()).items():
+            sql = str(query.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+            rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+def find_table_scans(db, queries=None):
+    """Returns {name: [plan details]} for every query whose plan falls back to a full table scan."""
+    return {name: plan for name, plan in explain_query_plans(db, queries).items()
+            if any(_reads_table(detail) for detail in plan)}
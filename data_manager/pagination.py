@@ -0,0 +1,22 @@
+import base64
+import json
+
+# Sort option -> (sort key, descending)
+MOVIE_SORTS = {
+    'title': ('sort_title', False),
+    'year': ('sort_year', True),
+    'rating': ('sort_rating', True),
+}
+
+
+def encode_cursor(*values):
+    """Packs the keyset position of the last row of a page into an opaque URL-safe string."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Unpacks a cursor made by encode_cursor, raising ValueError if it is malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError("Invalid page cursor") from e
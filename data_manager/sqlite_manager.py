@@ -1,13 +1,42 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import String, case, cast, delete, exists, func, literal, null, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from .catalog_migration import catalog_key
+from .pagination import MOVIE_SORTS, encode_cursor, decode_cursor
 from .data_manager_interface import DataManagerInterface
-from .data_models import Movie, User, Review
-from moviweb_app.extended.id_password_handler import check_password_hash
+from .data_models import CatalogMovie, EntityVersion, Movie, User, Review, movie_sort_keys
+from moviweb_app.extended.id_password_handler import check_password_hash, generate_password_hash, \
+    password_needs_rehash
+from moviweb_app.extended.login_handler import user_cache
 
 
 class SQLiteDataManager(DataManagerInterface):
     def __init__(self, db_file_name):
         self.db = SQLAlchemy(db_file_name)
 
+    def _bump_versions(self, *keys):
+        """Increments the version counters of the given entities as part of the current transaction."""
+        keys = {key for key in keys if key}
+        if not keys:
+            return
+        statement = insert(EntityVersion).values([{'key': key, 'version': 1} for key in keys])
+        self.db.session.execute(statement.on_conflict_do_update(
+            index_elements=['key'], set_={'version': EntityVersion.version + 1}))
+
+    def get_versions(self, keys):
+        """Returns the version counter of each given entity (0 for one never written) in a
+        single primary key lookup, or None on error."""
+        try:
+            rows = self.db.session.query(EntityVersion.key, EntityVersion.version) \
+                .filter(EntityVersion.key.in_(keys)).all()
+            versions = dict.fromkeys(keys, 0)
+            versions.update(rows)
+            return versions
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching entity versions: {str(e)}")
+            return None
+
     def get_all_users(self):
         try:
             db = self.db
@@ -18,6 +47,22 @@ class SQLiteDataManager(DataManagerInterface):
             print(f"Error while fetching users: {str(e)}")
             return []
 
+    def get_users_page(self, after_name=None, limit=50):
+        """Retrieves the ID and name of up to `limit` users ordered by name, starting
+        after the given name. Keyset pagination over the name index keeps every page
+        equally cheap, and password hashes are never selected."""
+        try:
+            db = self.db
+            query = db.session.query(User.id, User.name).filter(User.name.isnot(None))
+            if after_name is not None:
+                query = query.filter(User.name > after_name)
+            users = query.order_by(User.name).limit(limit).all()
+            return [{'id': user_id, 'name': name} for user_id, name in users]
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching users page: {str(e)}")
+            return []
+
     def get_user_name(self, user_id):
         try:
             db = self.db
@@ -31,6 +76,34 @@ class SQLiteDataManager(DataManagerInterface):
             print(f"Error while fetching user name: {str(e)}")
             return None  # Error occurred
 
+    def get_user_by_id(self, user_id):
+        """Retrieves a single user's data by primary key."""
+        try:
+            db = self.db
+            user = db.session.get(User, user_id)
+            if user:
+                return {'name': user.name, 'password': user.password, 'id': user.id}
+            else:
+                return None  # User with the specified ID not found
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching user: {str(e)}")
+            return None  # Error occurred
+
+    def get_user_by_name(self, user_name):
+        """Retrieves a single user's data through the unique index on the user name."""
+        try:
+            db = self.db
+            user = db.session.query(User).filter_by(name=user_name).first()
+            if user:
+                return {'name': user.name, 'password': user.password, 'id': user.id}
+            else:
+                return None  # User with the specified name not found
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching user: {str(e)}")
+            return None  # Error occurred
+
     def get_user_movies(self, user_id):
         try:
             db = self.db
@@ -41,35 +114,142 @@ class SQLiteDataManager(DataManagerInterface):
             print(f"Error while fetching user movies: {str(e)}")
             return []
 
+    def get_user_movie(self, user_id, movie_id):
+        """Retrieves one of the user's movies through the movie_id index, or None."""
+        try:
+            db = self.db
+            return db.session.query(Movie).filter(Movie.user_id == user_id, Movie.movie_id == movie_id).first()
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching user movie: {str(e)}")
+            return None
+
+    def get_user_movies_page(self, user_id, sort='title', cursor=None, limit=24):
+        """Retrieves one page of the user's movies and the cursor of the next page (None on the last one).
+        Pages are walked with a keyset on (sort key, id), served by the composite per-user sort indexes."""
+        sort_key, descending = MOVIE_SORTS.get(sort, MOVIE_SORTS['title'])
+        sort_column = getattr(Movie, sort_key)
+        try:
+            db = self.db
+            query = db.session.query(Movie).filter(Movie.user_id == user_id)
+            if cursor:
+                position = tuple_(sort_column, Movie.id)
+                last_values = tuple(decode_cursor(cursor))
+                query = query.filter(position < last_values if descending else position > last_values)
+            if descending:
+                query = query.order_by(sort_column.desc(), Movie.id.desc())
+            else:
+                query = query.order_by(sort_column, Movie.id)
+            movies = query.limit(limit + 1).all()
+        except ValueError:
+            raise
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching user movies page: {str(e)}")
+            return [], None
+
+        if len(movies) <= limit:
+            return movies, None
+        last_movie = movies[limit - 1]
+        return movies[:limit], encode_cursor(getattr(last_movie, sort_key), last_movie.id)
+
     def add_movie(self, user_id, movie_id, title, rating, year, poster, director, movie_link):
         try:
             db = self.db
+            imdb_id = catalog_key(movie_link, movie_id)
 
-            # Create a new Movie instance
-            new_movie = Movie(
-                movie_id=movie_id,
+            # Add the film to the shared catalog unless another user already did
+            db.session.execute(insert(CatalogMovie).values(
+                imdb_id=imdb_id,
                 title=title,
                 rating=rating,
                 year=year,
                 poster=poster,
                 director=director,
-                movie_link=movie_link,
+                movie_link=movie_link
+            ).on_conflict_do_nothing(index_elements=['imdb_id']))
+
+            # Link the catalog film to the user
+            new_movie = Movie(
+                movie_id=movie_id,
+                imdb_id=imdb_id,
                 user_id=user_id
             )
+            new_movie.catalog = db.session.get(CatalogMovie, imdb_id)
+            new_movie.refresh_sort_keys()
 
             # Add the new movie to the database
             db.session.add(new_movie)
+            self._bump_versions(f'user:{user_id}', f'movie:{movie_id}')
             db.session.commit()
 
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
             print(f"Error while adding a movie: {str(e)}")
             return None  # Error occurred, movie not added
 
+    def add_movies(self, user_id, movies):
+        """Adds a batch of movies to the user's list in one transaction. Each movie is a dict
+        with movie_id, title, rating, year, poster, director and movie_link.
+        Returns the number of movies added, or None on error."""
+        if not movies:
+            return 0
+        try:
+            db = self.db
+            catalog_rows = {}
+            for movie in movies:
+                imdb_id = catalog_key(movie['movie_link'], movie['movie_id'])
+                catalog_rows.setdefault(imdb_id, {
+                    'imdb_id': imdb_id,
+                    'title': movie['title'],
+                    'rating': movie['rating'],
+                    'year': movie['year'],
+                    'poster': movie['poster'],
+                    'director': movie['director'],
+                    'movie_link': movie['movie_link']
+                })
+            db.session.execute(insert(CatalogMovie).on_conflict_do_nothing(index_elements=['imdb_id']),
+                               list(catalog_rows.values()))
+
+            # Sort keys follow the catalog entry, which may predate this import
+            catalog = {entry.imdb_id: entry for entry in
+                       db.session.query(CatalogMovie).filter(CatalogMovie.imdb_id.in_(catalog_rows)).all()}
+            movie_rows = []
+            for movie in movies:
+                imdb_id = catalog_key(movie['movie_link'], movie['movie_id'])
+                entry = catalog[imdb_id]
+                sort_title, sort_year, sort_rating = movie_sort_keys(entry.title, entry.year, entry.rating)
+                movie_rows.append({'movie_id': movie['movie_id'], 'imdb_id': imdb_id, 'user_id': user_id,
+                                   'sort_title': sort_title, 'sort_year': sort_year, 'sort_rating': sort_rating})
+            db.session.execute(insert(Movie), movie_rows)
+            self._bump_versions(f'user:{user_id}', *(f'movie:{movie["movie_id"]}' for movie in movies))
+            db.session.commit()
+            return len(movie_rows)
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
+            print(f"Error while adding movies: {str(e)}")
+            return None  # Error occurred, no movie of the batch was added
+
+    def iter_user_movies(self, user_id, sort='title', batch_size=500):
+        """Yields all of the user's movies page by page, so a large library is never held in memory at once."""
+        cursor = None
+        while True:
+            movies, cursor = self.get_user_movies_page(user_id, sort, cursor, batch_size)
+            yield from movies
+            if cursor is None:
+                return
+            # Let the session forget the rows already handed out
+            self.db.session.expunge_all()
+
     def add_user(self, user_name, encrypted_password, user_id, email):
         try:
             db = self.db
 
+            if self.get_user_by_name(user_name):
+                return False  # User with the same name already exists
+
             # Create a new User instance
             new_user = User(
                 id=user_id,
@@ -80,40 +260,50 @@ class SQLiteDataManager(DataManagerInterface):
 
             # Add the new user to the database
             db.session.add(new_user)
+            self._bump_versions('users', f'user:{user_id}')
             db.session.commit()
 
             return True  # User added successfully
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
             print(f"Error while adding a user: {str(e)}")
             return None  # Error occurred, user not added
 
-    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link):
+    def update_movie(self, user_id, movie_id, new_movie_id, title, rating, year, poster, director, movie_link,
+                     version=None):
+        """Updates one of the user's movies with a single UPDATE statement. Values equal to the
+        shared catalog entry are stored as NULL so the movie keeps following the catalog.
+        If a version is given, the update only applies if the movie is still at that version.
+        Returns the number of movies updated (0 if not found or changed in the meantime), or None on error."""
         try:
             db = self.db
-
-            # Query the existing movie by user_id and movie_id
-            existing_movie = db.session.query(Movie).filter(
-                (Movie.user_id == user_id) & (Movie.movie_id == movie_id)).first()
-
-            if existing_movie:
-                # Update the movie's attributes
-                existing_movie.movie_id = new_movie_id
-                existing_movie.title = title
-                existing_movie.rating = rating
-                existing_movie.year = year
-                existing_movie.poster = poster
-                existing_movie.director = director
-                existing_movie.movie_link = movie_link
-
-                # Commit the changes to the database
-                db.session.commit()
-
-                return existing_movie  # Return the updated movie object
-            else:
-                return None  # Movie with the specified user_id and movie_id not found
+            columns = Movie.__table__.c
+            edits = {'title': title, 'rating': rating, 'year': year, 'poster': poster,
+                     'director': director, 'movie_link': movie_link}
+            values = {columns.movie_id: new_movie_id, columns.version: columns.version + 1}
+            for column, value in edits.items():
+                if value is None:
+                    values[columns[column]] = null()
+                    continue
+                catalog_value = select(getattr(CatalogMovie, column)) \
+                    .where(CatalogMovie.imdb_id == columns.imdb_id).scalar_subquery()
+                values[columns[column]] = case((cast(literal(value), String) == cast(catalog_value, String), null()),
+                                               else_=literal(value))
+            values[columns.sort_title], values[columns.sort_year], values[columns.sort_rating] = \
+                movie_sort_keys(title, year, rating)
+
+            statement = update(Movie.__table__).where(columns.user_id == user_id, columns.movie_id == movie_id)
+            if version is not None:
+                statement = statement.where(columns.version == version)
+            result = db.session.execute(statement.values(values))
+            if result.rowcount:
+                self._bump_versions(f'user:{user_id}', f'movie:{movie_id}', f'movie:{new_movie_id}')
+            db.session.commit()
+            return result.rowcount
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
             print(f"Error while updating a movie: {str(e)}")
             return None  # Error occurred, movie not updated
 
@@ -127,6 +317,7 @@ class SQLiteDataManager(DataManagerInterface):
             if existing_movie:
                 # Delete the movie from the database
                 db.session.delete(existing_movie)
+                self._bump_versions(f'user:{user_id}', f'movie:{existing_movie.movie_id}')
                 db.session.commit()
                 return True  # Movie successfully deleted
 
@@ -145,9 +336,15 @@ class SQLiteDataManager(DataManagerInterface):
             existing_user = db.session.query(User).filter_by(id=user_id).first()
 
             if existing_user:
+                # Their movies go with them, and their reviews lose the author's name
+                movie_ids = db.session.scalars(
+                    select(Movie.movie_id).where(Movie.user_id == user_id)
+                    .union(select(Review.movie_id).where(Review.user_id == user_id))).all()
                 # Delete the user from the database
                 db.session.delete(existing_user)
+                self._bump_versions('users', f'user:{user_id}', *(f'movie:{movie_id}' for movie_id in movie_ids))
                 db.session.commit()
+                user_cache.invalidate(user_id)
 
                 return True  # User successfully deleted
             else:
@@ -188,6 +385,7 @@ class SQLiteDataManager(DataManagerInterface):
 
                 # Commit the changes to the database
                 db.session.commit()
+                user_cache.invalidate(user_id)
 
                 return True  # Password successfully updated
             else:
@@ -198,23 +396,15 @@ class SQLiteDataManager(DataManagerInterface):
             return False  # Error occurred, password not updated
 
     def verify_user(self, username, password):
-        try:
-            db = self.db
-
-            # Query the user by username
-            user = db.session.query(User).filter_by(name=username).first()
-
-            if user:
-                # Check if the provided password matches the user's password
-                if check_password_hash(user.password, password):
-                    return user  # Username and password match
-                else:
-                    return None  # Password does not match
-
-        except Exception as e:
-            # Handle exceptions (e.g., database connection errors) here
-            print(f"Error while verifying user credentials: {str(e)}")
-            return False  # Error occurred
+        """Returns the user's data if the password matches the stored hash, otherwise None.
+        At most one bcrypt check is performed, against the row found by name."""
+        user = self.get_user_by_name(username)
+        if user and check_password_hash(user['password'], password):
+            if password_needs_rehash(user['password']):
+                # The work factor changed since this hash was made, upgrade it transparently
+                self.update_password(user['id'], generate_password_hash(password))
+            return user  # Username and password match
+        return None  # Unknown user or password does not match
 
     def check_movie_id_exist(self, movie_id):
         try:
@@ -231,87 +421,65 @@ class SQLiteDataManager(DataManagerInterface):
             return False  # Error occurred, consider the movie doesn't exist
 
     def add_reviews(self, review_id, user_id, movie_id, rating, likes, publication_date,
-                    review_text, review_title,):  # CHECKED
-        """Allows the user to publish a review for a certain movie with the given ID"""
-        # Check if the movie exists
+                    review_text, review_title,):
+        """Allows the user to publish a review for a certain movie with the given ID.
+        A single INSERT ... SELECT only writes the row if both the movie and the user exist.
+        Returns the number of reviews added (0 or 1), or None on error."""
         try:
             db = self.db
-            if not self.check_movie_id_exist(movie_id):
-                raise ValueError(f"Movie with not found")
-
-            # Check if the user exists
-            user = self.get_user_name(user_id)
-            if not user:
-                raise ValueError(f"User with ID {user_id} not found")
-            new_review = Review(
-                review_id=review_id,
-                user_id=user_id,
-                movie_id=movie_id,
-                rating=rating,
-                likes=likes,
-                publication_date=publication_date,
-                review_text=review_text,
-                review_title=review_title
-            )
-            db.session.add(new_review)
+            values = select(literal(review_id), literal(user_id), literal(movie_id), literal(rating), literal(likes),
+                            literal(publication_date), literal(review_text), literal(review_title)) \
+                .where(exists().where(Movie.movie_id == movie_id)) \
+                .where(exists().where(User.id == user_id))
+            result = db.session.execute(insert(Review).from_select(
+                ['review_id', 'user_id', 'movie_id', 'rating', 'likes', 'publication_date', 'review_text',
+                 'review_title'], values))
+            if result.rowcount:
+                self._bump_versions(f'movie:{movie_id}')
             db.session.commit()
-            return True
+            return result.rowcount
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
             print(f"Error while adding a review: {str(e)}")
             return None  # Error occurred, review not added
 
-    def edit_reviews(self, review_id, user_id, movie_id, rating, review_text, review_title):  # CHECKED
-        """Allows a user to edit his movie review"""
-        # Check if the movie exists
+    def edit_reviews(self, review_id, user_id, movie_id, rating, review_text, review_title):
+        """Allows a user to edit his movie review. The UPDATE only matches the review if it
+        belongs to that user and movie. Returns the number of reviews edited, or None on error."""
         try:
             db = self.db
-            if not self.check_movie_id_exist(movie_id):
-                raise ValueError(f"Movie with not found")
-
-            # Check if the user exists
-            user = self.get_user_name(user_id)
-            if not user:
-                raise ValueError(f"User with ID {user_id} not found")
-            existing_review = db.session.query(Review).filter_by(review_id=review_id).first()
-            if existing_review:
-                existing_review.rating = rating
-                existing_review.review_text = review_text
-                existing_review.review_title = review_title
-                db.session.commit()
-                return True
+            result = db.session.execute(
+                update(Review)
+                .where(Review.review_id == review_id, Review.user_id == user_id, Review.movie_id == movie_id)
+                .values(rating=rating, review_text=review_text, review_title=review_title))
+            if result.rowcount:
+                self._bump_versions(f'movie:{movie_id}')
+            db.session.commit()
+            return result.rowcount
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
+            self.db.session.rollback()
             print(f"Error while editing a review: {str(e)}")
             return None  # Error occurred, movie review not edited
 
-    def delete_reviews(self, user_id, movie_id, review_id):  # CHECKED
-        """deletes a review"""
-        # Check if the movie exists
+    def delete_reviews(self, user_id, movie_id, review_id):
+        """Deletes a review if it belongs to that user and movie.
+        Returns the number of reviews deleted, or None on error."""
         try:
             db = self.db
-            if not self.check_movie_id_exist(movie_id):
-                raise ValueError(f"Movie with not found")
-
-            # Check if the user exists
-            user = self.get_user_name(user_id)
-            if not user:
-                raise ValueError(f"User with ID {user_id} not found")
-
-            # Check if the review exists
-            existing_review = db.session.query(Review).filter(
-                review_id == review_id).first()
-            if not existing_review:
-                raise ValueError(f"Review not found with ID {review_id}")
-            # Delete the review
-            db.session.delete(existing_review)
+            result = db.session.execute(
+                delete(Review)
+                .where(Review.review_id == review_id, Review.user_id == user_id, Review.movie_id == movie_id))
+            if result.rowcount:
+                self._bump_versions(f'movie:{movie_id}')
             db.session.commit()
-            return True
-
+            return result.rowcount
         except Exception as e:
             # Handle exceptions (e.g., database connection errors) here
-            print(f"Error while deleting a movie: {str(e)}")
-            return None  # Error occurred, movie not deleted
+            self.db.session.rollback()
+            print(f"Error while deleting a review: {str(e)}")
+            return None  # Error occurred, review not deleted
 
     def get_movie_details(self, movie_id):
         """Retrieves a movie by its ID from the database."""
@@ -354,3 +522,47 @@ class SQLiteDataManager(DataManagerInterface):
             # Handle exceptions (e.g., database connection errors) here
             print(f"Error while fetching movie reviews: {str(e)}")
             return []  # Return an empty list if an error occurred
+
+    def get_movie_with_reviews(self, movie_id, sort='date', page=1, per_page=20):
+        """Retrieves a movie and one page of its reviews, each with its author's name, in a single
+        joined query. Reviews are sorted newest or most liked first.
+        Returns (movie, reviews, has_next_page); movie is None if it doesn't exist."""
+        try:
+            db = self.db
+            # publication_date is stored as dd-mm-YYYY, rebuild it as YYYYmmdd to sort chronologically
+            date_key = func.substr(Review.publication_date, 7, 4) \
+                .concat(func.substr(Review.publication_date, 4, 2)) \
+                .concat(func.substr(Review.publication_date, 1, 2))
+            if sort == 'likes':
+                order = (Review.likes.desc(), date_key.desc())
+            else:
+                order = (date_key.desc(), Review.likes.desc())
+            page = max(page, 1)
+            rows = db.session.query(Movie, Review, User.name) \
+                .outerjoin(Review, Review.movie_id == Movie.movie_id) \
+                .outerjoin(User, User.id == Review.user_id) \
+                .filter(Movie.movie_id == movie_id) \
+                .order_by(*order, Review.review_id) \
+                .limit(per_page + 1).offset((page - 1) * per_page).all()
+
+            if not rows:
+                # Either the movie doesn't exist or the page is past the last review
+                return self.get_movie_details(movie_id), [], False
+
+            reviews = [{
+                'review_id': review.review_id,
+                'user_id': review.user_id,
+                'username': username,
+                'movie_id': review.movie_id,
+                'rating': review.rating,
+                'likes': review.likes,
+                'publication_date': review.publication_date,
+                'review_text': review.review_text,
+                'review_title': review.review_title
+            } for _, review, username in rows if review is not None]
+            return rows[0][0], reviews[:per_page], len(reviews) > per_page
+
+        except Exception as e:
+            # Handle exceptions (e.g., database connection errors) here
+            print(f"Error while fetching movie details with reviews: {str(e)}")
+            return None, [], False
@@ -1,36 +1,171 @@
 import os
-from dotenv import load_dotenv
 import json
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
 import requests
 from colorama import Fore, init
+from moviweb_app.extended.http_client import http_client
 init()
 load_dotenv()
 
 
 API_KEY = os.getenv('MOVIE_API_KEY')
-URL = f'http://www.omdbapi.com/?i=tt3896198&apikey={API_KEY}'
+OMDB_URL = os.getenv('OMDB_URL', 'http://www.omdbapi.com/')
+CACHE_PATH = os.getenv('OMDB_CACHE_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'omdb_cache.db'))
+CACHE_TTL = int(os.getenv('OMDB_CACHE_TTL', str(7 * 24 * 3600)))
+NEGATIVE_CACHE_TTL = int(os.getenv('OMDB_NEGATIVE_CACHE_TTL', str(3600)))
+NOT_FOUND_ERROR = 'Movie not found!'
+
+
+class OmdbCache:
+    """Persistent cache of OMDb responses keyed by title, stored in a small SQLite file.
+    'Movie not found' answers are cached too, for a shorter time."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS omdb_cache '
+                               '(title_key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, title_key):
+        """Returns the cached payload for the title, or None if it is missing or expired."""
+        with self._connect() as connection:
+            row = connection.execute('SELECT payload, expires_at FROM omdb_cache WHERE title_key = ?',
+                                     (title_key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, title_key, payload):
+        """Stores a payload, using the negative TTL for 'not found' answers. Other error
+        answers, such as an invalid API key or a reached request limit, say nothing about
+        the title and are not stored."""
+        if payload.get('Response') != 'False':
+            ttl = self.ttl
+        elif payload.get('Error') == NOT_FOUND_ERROR:
+            ttl = self.negative_ttl
+        else:
+            return
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO omdb_cache (title_key, payload, expires_at) VALUES (?, ?, ?)',
+                               (title_key, json.dumps(payload), time.time() + ttl))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key so only one of them does the work."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not is_leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_in_flight = SingleFlight()
+
+
+def _get_cache():
+    """Opens the cache lazily so importing this module doesn't touch the disk."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OmdbCache()
+        return _cache
+
+
+def _request_movie(movie):
+    response = http_client.get(OMDB_URL, params={'apikey': API_KEY, 't': movie})
+    response.raise_for_status()  # raise an exception if the response status code is not 200 OK
+    return response.json()
+
+
+def fetch_movie(movie):
+    """Returns the OMDb payload for a title, from the cache when possible.
+    Concurrent lookups of the same uncached title share a single outbound request."""
+    title_key = movie.strip().lower()
+    cache = _get_cache()
+    data_result = cache.get(title_key)
+    if data_result is not None:
+        return data_result
+
+    def fetch():
+        cached = cache.get(title_key)
+        if cached is not None:
+            return cached
+        payload = _request_movie(movie)
+        cache.put(title_key, payload)
+        return payload
+
+    return _in_flight.do(title_key, fetch)
 
 
 def data_extractor(movie):
     try:
-        response = requests.get(f'http://www.omdbapi.com/?i=tt3896198&apikey={API_KEY}&t={movie}')
-        response.raise_for_status()  # raise an exception if the response status code is not 200 OK
-        data_result = response.json()
-        return data_result
+        return fetch_movie(movie)
     except requests.exceptions.RequestException as e:
         print(Fore.RED + "An error occurred while trying to access the API:", e, Fore.RESET)
         return None
 
 
-def get_imdb_link(title):
-    # Make a request to the OMDb API
-    response = requests.get(f'http://www.omdbapi.com/?apikey={API_KEY}&t={title}')
+def imdb_link_from_data(movie_info):
+    """Builds the IMDb link from an OMDb payload, or None if it has no IMDb ID."""
+    imdb_id = movie_info.get('imdbID') if movie_info else None
+    if not imdb_id:
+        return None
+    return f'https://www.imdb.com/title/{imdb_id}/'
 
-    # Parse the JSON response
-    data = json.loads(response.text)
 
-    # Extract the IMDb link
-    imdb_id = data.get('imdbID')
-    imdb_link = f'https://www.imdb.com/title/{imdb_id}/'
+def get_imdb_link(title):
+    return imdb_link_from_data(data_extractor(title))
+
 
-    return imdb_link
+def parse_movie_info(movie_info):
+    """Turns an OMDb payload into the fields stored for a movie, or None if the
+    payload is missing the title, director or a numeric year."""
+    if movie_info is None or 'Title' not in movie_info or 'Year' not in movie_info or 'Director' not in movie_info:
+        return None
+    year_str = movie_info.get('Year')
+    if not year_str.isdigit():
+        return None
+    ratings = movie_info.get('Ratings') or []
+    try:
+        rating = float(ratings[0]['Value'].split("/")[0]) if ratings else None
+    except ValueError:
+        rating = None  # e.g. a percentage score instead of x/10
+    return {
+        'title': movie_info.get('Title'),
+        'rating': rating,
+        'year': int(year_str),
+        'poster': movie_info.get('Poster'),
+        'director': movie_info.get('Director'),
+        'movie_link': imdb_link_from_data(movie_info)
+    }
@@ -1,12 +1,14 @@
 import os
 from dotenv import load_dotenv
-import requests
+from moviweb_app.extended.http_client import http_client
 
 load_dotenv()
 
 RAPID_API_KEY = os.getenv('RAPID_API_KEY')
 
-url = "https://chatgpt-api8.p.rapidapi.com/"
+url = os.getenv('CHAT_API_URL', "https://chatgpt-api8.p.rapidapi.com/")
+# LLM answers routinely take several seconds
+CHAT_TIMEOUT = (3.05, float(os.getenv('CHAT_API_READ_TIMEOUT', '60')))
 
 
 def chat_interface(question):
@@ -22,7 +24,9 @@ def chat_interface(question):
         "X-RapidAPI-Host": "chatgpt-api8.p.rapidapi.com"
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    # Completions are billed, so only retry when the request never reached the API
+    response = http_client.post(url, json=payload, headers=headers, timeout=CHAT_TIMEOUT, retry_on_error=False)
+    response.raise_for_status()
     json_response = response.json()
     if 'text' in json_response:
         result = json_response['text']
@@ -69,6 +73,20 @@ def random_prompt(username):
     return query
 
 
+NAME_PLACEHOLDER = '[[NAME]]'
+
+
+def random_pool_prompt():
+    """Same as random_prompt, but with a placeholder for the name so the answer
+    can be pooled and shared between users."""
+    return random_prompt(NAME_PLACEHOLDER)
+
+
+def personalize(answer, username):
+    """Fills the user's name into an answer generated from random_pool_prompt."""
+    return answer.replace(NAME_PLACEHOLDER, username or '')
+
+
 query = """You are now a movie app owner.
 
     The user Maude, just signed up for your website, Moviepedia, where he can add all his favorite 
@@ -0,0 +1,153 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '15'))
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', '10'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without calling the host while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures. Once the cool-down has passed,
+    a single trial request is let through while the others are still rejected: the
+    circuit closes if it succeeds and opens again if it fails. A trial that never
+    reports back is given up after another cool-down, and the next caller tries."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False  # Half-open, another caller's trial request is in flight
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_started is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+
+class OutboundClient:
+    """Shared HTTP client for the third-party APIs: pooled keep-alive connections,
+    a concurrency limit and circuit breaker per host, default timeouts and
+    bounded retries with jittered exponential backoff. A transport adapter may be given
+    to control how connections are made."""
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 max_per_host=MAX_PER_HOST, backoff=0.25, adapter=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_per_host = max_per_host
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = adapter or HTTPAdapter(pool_connections=10, pool_maxsize=max_per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Registers a function called after every request as listener(host, seconds, outcome),
+        where outcome is the final status code or the name of the exception raised."""
+        self._listeners.append(listener)
+
+    def _notify(self, host, started, outcome):
+        for listener in self._listeners:
+            try:
+                listener(host, time.perf_counter() - started, outcome)
+            except Exception as e:
+                print(f"Error in an outbound request listener: {str(e)}")
+
+    def _host_state(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.BoundedSemaphore(self.max_per_host), CircuitBreaker())
+            return host, self._hosts[host]
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, url, retry_on_error=True, **kwargs):
+        """Sends a request and returns the response. Connection errors are always retried;
+        timeouts and retryable statuses only when retry_on_error is set."""
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self._request(method, url, retry_on_error, **kwargs)
+        except Exception as e:
+            self._notify(host, started, type(e).__name__)
+            raise
+        self._notify(host, started, str(response.status_code))
+        return response
+
+    def _request(self, method, url, retry_on_error, **kwargs):
+        host, (slots, breaker) = self._host_state(url)
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {host}, skipping the request.")
+            try:
+                with slots:
+                    response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError:
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+            except requests.exceptions.Timeout:
+                breaker.record_failure()
+                if not retry_on_error or attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if not retry_on_error or attempt >= self.max_retries:
+                    return response
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+http_client = OutboundClient()
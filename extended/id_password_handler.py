@@ -1,6 +1,102 @@
+import os
+import threading
+import time
 import uuid
 import bcrypt
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '4'))
+HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', '64'))
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool so a burst of signups or logins
+    can't pin every request thread. bcrypt releases the GIL while hashing."""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, max_workers=HASH_WORKERS,
+                 max_queue=HASH_QUEUE_SIZE, timeout=HASH_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_time = 0.0
+        self._hash_time = 0.0
+        self._max_latency = 0.0
+
+    def _run(self, func, *args):
+        """Submits a bcrypt call to the pool and waits for its result."""
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rejected += 1
+            raise RuntimeError("Password hashing queue is full, please try again.")
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_time += started_at - submitted_at
+            try:
+                return func(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._hash_time += finished_at - started_at
+                    self._max_latency = max(self._max_latency, finished_at - submitted_at)
+                self._slots.release()
+
+        return self._executor.submit(task).result()
+
+    def hash(self, plain_password):
+        """Hashes a password with the configured work factor."""
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        hashed_password = self._run(bcrypt.hashpw, plain_password.encode('utf-8'), salt)
+        return hashed_password.decode('utf-8')
+
+    def verify(self, hashed_password, plain_password):
+        """Checks a password against a stored bcrypt hash."""
+        return self._run(bcrypt.checkpw, plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    def needs_rehash(self, hashed_password):
+        """Returns True if the hash was made with a different work factor than the configured one."""
+        try:
+            return int(hashed_password.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        """Returns queue depth and latency figures for sizing the pool."""
+        with self._lock:
+            completed = self._completed
+            return {
+                'rounds': self.rounds,
+                'queued': self._queued,
+                'running': self._running,
+                'completed': completed,
+                'rejected': self._rejected,
+                'avg_wait_seconds': self._wait_time / completed if completed else 0.0,
+                'avg_hash_seconds': self._hash_time / completed if completed else 0.0,
+                'max_latency_seconds': self._max_latency,
+            }
+
+
+password_hasher = PasswordHasher()
 
 
 def id_generator():
@@ -9,12 +105,15 @@ def id_generator():
 
 
 def generate_password_hash(plain_password):
-    hashed_password = bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt())
-    return hashed_password.decode('utf-8')
+    return password_hasher.hash(plain_password)
 
 
 def check_password_hash(hashed_password, plain_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return password_hasher.verify(hashed_password, plain_password)
+
+
+def password_needs_rehash(hashed_password):
+    return password_hasher.needs_rehash(hashed_password)
 
 
 def save_date():
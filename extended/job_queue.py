@@ -0,0 +1,117 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_PATH = os.getenv('JOBS_DB_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'jobs.db'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# How long a claimed job belongs to its worker; after that it is presumed lost with its process
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    """Background job queue run by in-process worker threads. Jobs are stored in
+    a SQLite table, so pending work is picked up again after a restart.
+
+    Several processes may share the table. A claimed job is leased to its worker
+    for lease_seconds; a job still 'running' after that is presumed lost with a
+    crashed process and claimed again, so handlers must finish within the lease."""
+
+    def __init__(self, path=JOBS_PATH, num_workers=JOB_WORKERS, poll_interval=1.0, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._handlers = {}
+        self._wakeup = threading.Event()
+        self._workers = []
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, job_key TEXT, '
+                               'payload TEXT NOT NULL, status TEXT NOT NULL, result TEXT, '
+                               'attempts INTEGER NOT NULL DEFAULT 0, created_at REAL, updated_at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, id)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_jobs_job_key ON jobs (job_key)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def register(self, kind, handler):
+        """Registers the function that runs jobs of the given kind. It receives the payload dict."""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload, job_key=None):
+        """Stores a new pending job and wakes a worker. Returns the job ID."""
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute('INSERT INTO jobs (kind, job_key, payload, status, created_at, updated_at) '
+                                        "VALUES (?, ?, ?, 'pending', ?, ?)",
+                                        (kind, job_key, json.dumps(payload), now, now))
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def get_job(self, job_key):
+        """Returns the status and result of the latest job with the given key, or None."""
+        with self._connect() as connection:
+            row = connection.execute('SELECT status, result FROM jobs WHERE job_key = ? ORDER BY id DESC LIMIT 1',
+                                     (job_key,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'result': row[1]}
+
+    def _claim(self):
+        """Atomically marks the oldest pending job, or running job whose lease expired, as
+        running and returns it."""
+        now = time.time()
+        with self._connect() as connection:
+            return connection.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                                      "WHERE id = (SELECT id FROM jobs WHERE status = 'pending' "
+                                      "OR (status = 'running' AND updated_at < ?) ORDER BY id LIMIT 1) "
+                                      'RETURNING id, kind, payload, attempts',
+                                      (now, now - self.lease_seconds)).fetchone()
+
+    def _finish(self, job_id, status, result):
+        with self._connect() as connection:
+            connection.execute('UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?',
+                               (status, result, time.time(), job_id))
+
+    def _run_job(self, job):
+        job_id, kind, payload, attempts = job
+        if attempts > MAX_ATTEMPTS:
+            # Reclaimed after its worker was lost on the last attempt
+            self._finish(job_id, 'failed', None)
+            return
+        try:
+            result = self._handlers[kind](json.loads(payload))
+            self._finish(job_id, 'done', result)
+        except Exception as e:
+            print(f"Error while running job {job_id} ({kind}): {str(e)}")
+            status = 'pending' if attempts < MAX_ATTEMPTS else 'failed'
+            self._finish(job_id, status, None)
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run_job(job)
+
+    def start(self):
+        """Starts the worker threads. Jobs interrupted by a previous shutdown are claimed
+        again once their lease expires, not here: another process may still be running them."""
+        if self._workers:
+            return
+        for number in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+
+job_queue = JobQueue()
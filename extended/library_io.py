@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from dotenv import load_dotenv
+from moviweb_app.extended.api_extractor import data_extractor, parse_movie_info
+from moviweb_app.extended.id_password_handler import id_generator
+
+load_dotenv()
+
+IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '8'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '200'))
+EXPORT_FIELDS = ['movie_id', 'title', 'year', 'rating', 'director', 'poster', 'movie_link']
+
+
+def read_titles(lines, file_format):
+    """Yields the movie titles of a CSV (with a 'title' column, or titles in the first column)
+    or JSON lines ({"title": ...} per line) import, one at a time."""
+    if file_format == 'jsonl':
+        for line in lines:
+            if line.strip():
+                title = json.loads(line).get('title')
+                if title:
+                    yield title.strip()
+        return
+    rows = csv.reader(lines)
+    header = next(rows, None)
+    if header is None:
+        return
+    lowered = [column.strip().lower() for column in header]
+    if 'title' in lowered:
+        column = lowered.index('title')
+    else:
+        column = 0
+        rows = _prepend(header, rows)  # No header row, the first line is a title too
+    for row in rows:
+        if len(row) > column and row[column].strip():
+            yield row[column].strip()
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def guess_format(filename=None, content_type=None):
+    """Picks 'jsonl' or 'csv' from a file name or content type, defaulting to CSV."""
+    if (filename or '').endswith(('.jsonl', '.ndjson', '.json')) or 'json' in (content_type or ''):
+        return 'jsonl'
+    return 'csv'
+
+
+def _resolve(title):
+    """Looks a title up on OMDb and returns the movie to store, or None if it wasn't found."""
+    movie_info = parse_movie_info(data_extractor(title))
+    if movie_info is not None:
+        movie_info['movie_id'] = id_generator()
+    return movie_info
+
+
+def import_movies(data_manager, user_id, titles, workers=IMPORT_WORKERS, batch_size=IMPORT_BATCH_SIZE):
+    """Resolves titles on OMDb with a bounded pool of workers and stores them in batched
+    transactions. Only one batch of titles is in memory at a time.
+    Returns a summary with the number of movies imported and the titles not found."""
+    imported = 0
+    not_found = []
+    titles = iter(titles)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as executor:
+        while True:
+            batch = list(islice(titles, batch_size))
+            if not batch:
+                break
+            movies = []
+            for title, movie in zip(batch, executor.map(_resolve, batch)):
+                if movie is None:
+                    not_found.append(title)
+                else:
+                    movies.append(movie)
+            added = data_manager.add_movies(user_id, movies)
+            if added is None:
+                raise RuntimeError("An error occurred while importing movies.")
+            imported += added
+    return {'imported': imported, 'not_found': not_found}
+
+
+def _movie_values(movie):
+    if isinstance(movie, dict):
+        # JSON storage keeps the movie ID under 'id'
+        return [movie.get('id') if field == 'movie_id' else movie.get(field) for field in EXPORT_FIELDS]
+    return [getattr(movie, field) for field in EXPORT_FIELDS]
+
+
+def export_movies(movies, file_format='csv'):
+    """Yields the export file chunk by chunk (one line per movie) from an iterable of movies."""
+    if file_format == 'jsonl':
+        for movie in movies:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, _movie_values(movie)))) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for movie in movies:
+        writer.writerow(_movie_values(movie))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
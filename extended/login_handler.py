@@ -1,3 +1,6 @@
+import threading
+import time
+from collections import OrderedDict
 from flask_login import UserMixin
 
 
@@ -21,3 +24,48 @@ class User(UserMixin):
     def is_anonymous(self):
         """Checks if the user is anonymous."""
         return False
+
+
+class UserCache:
+    """A small per-process LRU cache of User objects with a time-to-live,
+    so the user loader doesn't hit the data manager on every request."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Returns the cached User for the given ID, or None if missing or expired."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return user
+
+    def put(self, user):
+        """Caches a User object, evicting the least recently used one if full."""
+        with self._lock:
+            self._users[user.get_id()] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.get_id())
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Drops the cached User for the given ID, if any."""
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        """Drops every cached User."""
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from moviweb_app.extended.http_client import http_client
+from moviweb_app.extended.id_password_handler import password_hasher
+from moviweb_app.extended.poster_cache import poster_client
+
+load_dotenv()
+
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '0.5'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """A monotonically increasing value per label set, in Prometheus terms."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Counts observations into cumulative buckets per label set, in Prometheus terms."""
+
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    bucket_labels = _format_labels(self.label_names, labels, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+                inf_labels = _format_labels(self.label_names, labels, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{inf_labels} {series["count"]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {series["sum"]}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {series["count"]}')
+        return lines
+
+
+class Metrics:
+    """Request, database, outbound call and bcrypt figures of this process, rendered in the
+    Prometheus text format. Each worker process keeps its own figures."""
+
+    def __init__(self, slow_request_seconds=SLOW_REQUEST_SECONDS):
+        self.slow_request_seconds = slow_request_seconds
+        self.requests = Counter('moviweb_http_requests_total', 'HTTP requests by route, method and status.',
+                                ('route', 'method', 'status'))
+        self.request_duration = Histogram('moviweb_http_request_duration_seconds', 'HTTP request latency by route.',
+                                          LATENCY_BUCKETS, ('route', 'method'))
+        self.request_queries = Histogram('moviweb_http_request_queries', 'SQL statements run per HTTP request.',
+                                         QUERY_COUNT_BUCKETS, ('route',))
+        self.request_query_time = Histogram('moviweb_http_request_query_seconds',
+                                            'Time spent in SQL per HTTP request.', LATENCY_BUCKETS, ('route',))
+        self.query_duration = Histogram('moviweb_db_query_duration_seconds', 'SQL statement latency.',
+                                        QUERY_BUCKETS)
+        self.outbound_duration = Histogram('moviweb_outbound_request_duration_seconds',
+                                           'Outbound HTTP call latency, retries included, by host and outcome.',
+                                           LATENCY_BUCKETS, ('host', 'outcome'))
+
+    def init_app(self, app, engine):
+        """Hooks the request middleware into the Flask app and the query timers into the engine."""
+        app.before_request(self._start_request)
+        app.after_request(self._note_status)
+        app.teardown_request(self._finish_request)
+        event.listen(engine, 'before_cursor_execute', self._start_query)
+        event.listen(engine, 'after_cursor_execute', self._finish_query)
+        event.listen(engine, 'handle_error', self._fail_query)
+        for client in (http_client, poster_client):
+            client.add_listener(lambda host, seconds, outcome: self.outbound_duration.observe(seconds, host, outcome))
+
+    @staticmethod
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = []
+
+    @staticmethod
+    def _note_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _finish_request(self, exception):
+        """Records the request on teardown, which also runs when a view or another after_request
+        hook raised. A request that never produced a response is counted as a 500."""
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        queries = g.pop('metrics_queries', [])
+        status = g.pop('metrics_status', None)
+        if status is None or exception is not None:
+            status = 500
+        # The URL rule keeps the label set bounded; unmatched paths share one label
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.requests.inc(route, request.method, str(status))
+        self.request_duration.observe(seconds, route, request.method)
+        self.request_queries.observe(len(queries), route)
+        self.request_query_time.observe(sum(query_seconds for _, query_seconds in queries), route)
+        if seconds >= self.slow_request_seconds:
+            self._log_slow_request(seconds, queries)
+
+    @staticmethod
+    def _log_slow_request(seconds, queries):
+        lines = [f"Slow request: {request.method} {request.full_path.rstrip('?')} took {seconds * 1000:.1f} ms, "
+                 f"{len(queries)} queries in {sum(q for _, q in queries) * 1000:.1f} ms"]
+        for statement, query_seconds in queries:
+            lines.append(f"  {query_seconds * 1000:8.2f} ms  {' '.join(statement.split())}")
+        print('\n'.join(lines))
+
+    @staticmethod
+    def _start_query(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    def _finish_query(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info['metrics_query_started'].pop()
+        seconds = time.perf_counter() - started
+        self.query_duration.observe(seconds)
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries.append((statement, seconds))
+
+    def _fail_query(self, exception_context):
+        """Times a failed statement too, so its start time doesn't stay on the stack and skew the next one."""
+        connection, context = exception_context.connection, exception_context.execution_context
+        if connection is None or context is None:
+            return  # Failed before the statement was sent, _start_query didn't run
+        if connection.info.get('metrics_query_started'):
+            self._finish_query(connection, context.cursor, exception_context.statement,
+                               exception_context.parameters, context, False)
+
+    @staticmethod
+    def _bcrypt_lines():
+        stats = password_hasher.stats()
+        completed = stats['completed']
+        figures = [
+            ('moviweb_bcrypt_operations_total', 'counter', 'Completed bcrypt hashes and checks.', completed),
+            ('moviweb_bcrypt_rejected_total', 'counter', 'bcrypt calls rejected because the queue was full.',
+             stats['rejected']),
+            ('moviweb_bcrypt_hash_seconds_total', 'counter', 'Time spent running bcrypt.',
+             stats['avg_hash_seconds'] * completed),
+            ('moviweb_bcrypt_wait_seconds_total', 'counter', 'Time bcrypt calls waited for a worker.',
+             stats['avg_wait_seconds'] * completed),
+            ('moviweb_bcrypt_queued', 'gauge', 'bcrypt calls waiting for a worker.', stats['queued']),
+            ('moviweb_bcrypt_running', 'gauge', 'bcrypt calls running.', stats['running']),
+            ('moviweb_bcrypt_rounds', 'gauge', 'bcrypt work factor of new hashes.', stats['rounds']),
+        ]
+        lines = []
+        for name, kind, help_text, value in figures:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return lines
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in (self.requests, self.request_duration, self.request_queries, self.request_query_time,
+                       self.query_duration, self.outbound_duration):
+            lines += metric.render()
+        lines += self._bcrypt_lines()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
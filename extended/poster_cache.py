@@ -0,0 +1,242 @@
+import os
+import io
+import hashlib
+import ipaddress
+import sqlite3
+import tempfile
+import time
+from urllib.parse import urljoin, urlsplit
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from moviweb_app.extended.http_client import OutboundClient, MAX_PER_HOST
+from moviweb_app.extended.api_extractor import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow the original image is stored for every size
+    Image = None
+
+load_dotenv()
+
+POSTER_DIR = os.getenv('POSTER_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'posters'))
+POSTER_INDEX_PATH = os.getenv('POSTER_INDEX_PATH',
+                              os.path.join(os.path.dirname(__file__), '..', 'data', 'posters.db'))
+POSTER_FAILURE_TTL = int(os.getenv('POSTER_FAILURE_TTL', str(10 * 60)))
+POSTER_MAX_BYTES = int(os.getenv('POSTER_MAX_BYTES', str(5 * 1024 * 1024)))
+POSTER_MAX_AGE = 365 * 24 * 3600
+# Poster URLs can be edited by users, so only these image hosts (and their subdomains) are fetched
+POSTER_HOSTS = [host.strip().lower() for host in
+                os.getenv('POSTER_HOSTS', 'm.media-amazon.com,images-na.ssl-images-amazon.com,ia.media-imdb.com')
+                .split(',') if host.strip()]
+POSTER_MAX_REDIRECTS = 3
+# Bounding boxes of the stored variants: grid tiles and the movie details page
+POSTER_SIZES = {'thumb': (200, 300), 'detail': (400, 600)}
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
+PLACEHOLDER_SVG = ('<svg xmlns="http://www.w3.org/2000/svg" width="200" height="300" viewBox="0 0 200 300">'
+                   '<rect width="200" height="300" fill="#2b2b2b"/>'
+                   '<text x="100" y="155" fill="#bbbbbb" font-family="sans-serif" font-size="16" '
+                   'text-anchor="middle">No poster</text></svg>')
+
+
+def poster_version(poster_url):
+    """Short hash of the poster URL, added to the proxy URL so a changed poster gets a new address."""
+    return hashlib.sha1((poster_url or '').encode('utf-8')).hexdigest()[:12]
+
+
+def allowed_poster_url(url):
+    """Whether the poster URL is http(s) on one of the POSTER_HOSTS."""
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        parts.port  # Raises on a malformed port
+    except ValueError:
+        return False
+    return parts.scheme in ('http', 'https') and \
+        any(host == allowed or host.endswith(f'.{allowed}') for allowed in POSTER_HOSTS)
+
+
+def check_public_address(host, address):
+    """Raises ValueError unless the address is a public one, so an allowed name pointing
+    at a loopback, private or link-local address isn't fetched."""
+    address = ipaddress.ip_address(address.split('%')[0])
+    if getattr(address, 'ipv4_mapped', None):
+        address = address.ipv4_mapped
+    if not address.is_global:
+        raise ValueError(f"Poster host '{host}' resolves to a non-public address")
+
+
+class _PublicAddressMixin:
+    """Checks the address a new connection actually reached before anything is sent on it.
+    Checking the name before the request wouldn't do: it is resolved again on connect, and
+    a rebinding DNS server can answer with a private address the second time."""
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        try:
+            check_public_address(self.host, sock.getpeername()[0])
+        except ValueError:
+            sock.close()
+            raise
+        return sock
+
+
+class _PublicHTTPConnection(_PublicAddressMixin, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicAddressMixin, HTTPSConnection):
+    pass
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """Transport adapter that only connects to public addresses."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _PublicHTTPConnectionPool,
+                                                   'https': _PublicHTTPSConnectionPool}
+
+
+def _poster_client():
+    client = OutboundClient(adapter=PublicAddressAdapter(pool_connections=10, pool_maxsize=MAX_PER_HOST))
+    # A proxy from the environment would be the peer that gets checked, not the poster host
+    client.session.trust_env = False
+    return client
+
+
+poster_client = _poster_client()
+
+
+def resize_variants(content, content_type):
+    """Returns {size: (bytes, content_type)} for every entry of POSTER_SIZES."""
+    if Image is None:
+        return {size: (content, content_type) for size in POSTER_SIZES}
+    variants = {}
+    for size, box in POSTER_SIZES.items():
+        with Image.open(io.BytesIO(content)) as image:
+            image = image.convert('RGB')
+            image.thumbnail(box)
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=85, optimize=True)
+        variants[size] = (output.getvalue(), 'image/jpeg')
+    return variants
+
+
+class PosterCache:
+    """Fetches each poster once and keeps its resized variants on local disk, named by
+    the hash of their content. A small SQLite index maps poster URLs to those files.
+    Failed fetches are remembered for a while so an unreachable origin isn't hammered."""
+
+    def __init__(self, directory=POSTER_DIR, index_path=POSTER_INDEX_PATH, failure_ttl=POSTER_FAILURE_TTL):
+        self.directory = directory
+        self.index_path = index_path
+        self.failure_ttl = failure_ttl
+        self._in_flight = SingleFlight()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS posters (url TEXT PRIMARY KEY, thumb TEXT, detail TEXT, '
+                               'content_type TEXT, failed_until REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=5)
+
+    def _lookup(self, url):
+        with self._connect() as connection:
+            return connection.execute('SELECT thumb, detail, content_type, failed_until FROM posters WHERE url = ?',
+                                      (url,)).fetchone()
+
+    def _entry(self, row, size):
+        """Returns (path, etag, content_type) of a stored variant if its file is still there."""
+        file_name = row[0] if size == 'thumb' else row[1]
+        if not file_name:
+            return None
+        path = os.path.join(self.directory, file_name)
+        if not os.path.exists(path):
+            return None
+        return path, os.path.splitext(file_name)[0], row[2]
+
+    def get(self, url, size='thumb'):
+        """Returns (path, etag, content_type) of the poster variant, fetching the poster
+        if it isn't stored yet, or None if it can't be had right now or its host isn't allowed."""
+        if not allowed_poster_url(url):
+            return None
+        row = self._lookup(url)
+        if row is not None:
+            entry = self._entry(row, size)
+            if entry is not None:
+                return entry
+            if row[3] and row[3] > time.time():
+                return None
+        try:
+            row = self._in_flight.do(url, lambda: self._fetch(url))
+        except Exception as e:
+            print(f"Error while fetching the poster '{url}': {str(e)}")
+            with self._connect() as connection:
+                connection.execute('INSERT OR REPLACE INTO posters (url, failed_until) VALUES (?, ?)',
+                                   (url, time.time() + self.failure_ttl))
+            return None
+        return self._entry(row, size)
+
+    def _fetch(self, url):
+        row = self._lookup(url)
+        if row is not None and self._entry(row, 'thumb') and self._entry(row, 'detail'):
+            return row  # Stored by a concurrent request in the meantime
+        response = self._open(url)
+        try:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            if content_type not in EXTENSIONS:
+                raise ValueError(f"Unexpected content type '{content_type}'")
+            content = response.raw.read(POSTER_MAX_BYTES + 1, decode_content=True)
+            if len(content) > POSTER_MAX_BYTES:
+                raise ValueError("Poster is too large")
+        finally:
+            response.close()
+
+        file_names = {}
+        for size, (data, variant_type) in resize_variants(content, content_type).items():
+            file_names[size] = self._store(data, EXTENSIONS[variant_type])
+            content_type = variant_type
+        row = (file_names['thumb'], file_names['detail'], content_type, None)
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO posters (url, thumb, detail, content_type, failed_until) '
+                               'VALUES (?, ?, ?, ?, NULL)', (url,) + row[:3])
+        return row
+
+    @staticmethod
+    def _open(url):
+        """Requests the poster, following redirects one at a time so every hop is checked
+        against the allowed hosts. poster_client only connects to public addresses."""
+        for _ in range(POSTER_MAX_REDIRECTS + 1):
+            if not allowed_poster_url(url):
+                raise ValueError(f"Poster host not allowed: '{url}'")
+            response = poster_client.get(url, stream=True, allow_redirects=False)
+            if not response.is_redirect:
+                return response
+            url = urljoin(url, response.headers['Location'])
+            response.close()
+        raise ValueError("Too many redirects")
+
+    def _store(self, data, extension):
+        """Writes the bytes under their content hash, once, and returns the file name."""
+        file_name = hashlib.sha256(data).hexdigest() + extension
+        path = os.path.join(self.directory, file_name)
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile('wb', dir=self.directory, suffix='.tmp', delete=False) as file:
+                file.write(data)
+            os.replace(file.name, path)
+        return file_name
+
+
+poster_cache = PosterCache()
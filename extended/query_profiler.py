@@ -0,0 +1,131 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+load_dotenv()
+
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', '0') == '1'
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '0') == '1'
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0.05'))
+REPEATED_QUERY_THRESHOLD = int(os.getenv('REPEATED_QUERY_THRESHOLD', '3'))
+
+_IN_LIST = re.compile(r'IN \((?:\?, )*\?\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a route runs more SQL statements than its declared budget."""
+
+
+def query_budget(max_queries):
+    """Declares the most SQL statements a route may run per request. Checked by the
+    query profiler; the attribute survives functools.wraps-based decorators."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def statement_shape(statement):
+    """Normalizes a statement so that runs differing only in parameters compare equal."""
+    return _IN_LIST.sub('IN (?)', ' '.join(statement.split()))
+
+
+class QueryProfiler:
+    """Development aid that records every SQL statement of a request and reports:
+    statement shapes repeated within the request (likely N+1 lookups from a loop or a
+    lazy relationship), the query plan of statements slower than the threshold, and
+    routes going over their query_budget. Over-budget routes raise while the app is
+    testing or QUERY_BUDGET_STRICT is set, and only print a warning otherwise."""
+
+    def __init__(self, slow_query_seconds=SLOW_QUERY_SECONDS, repeated_threshold=REPEATED_QUERY_THRESHOLD,
+                 strict=QUERY_BUDGET_STRICT):
+        self.slow_query_seconds = slow_query_seconds
+        self.repeated_threshold = repeated_threshold
+        self.strict = strict
+        self.engine = None
+
+    def init_app(self, app, engine):
+        self.engine = engine
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        event.listen(engine, 'before_cursor_execute', self._start_query)
+        event.listen(engine, 'after_cursor_execute', self._finish_query)
+        event.listen(engine, 'handle_error', self._fail_query)
+
+    @staticmethod
+    def _start_request():
+        g.profiled_queries = []
+
+    @staticmethod
+    def _start_query(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('profiler_query_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _finish_query(connection, cursor, statement, parameters, context, executemany):
+        started = connection.info['profiler_query_started'].pop()
+        if has_request_context() and 'profiled_queries' in g and not connection.info.get('profiler_explaining'):
+            g.profiled_queries.append((statement, parameters, executemany, time.perf_counter() - started))
+
+    @staticmethod
+    def _fail_query(exception_context):
+        """Drops the start time of a statement that raised, which after_cursor_execute never saw."""
+        connection = exception_context.connection
+        if connection is None or exception_context.execution_context is None:
+            return
+        started_stack = connection.info.get('profiler_query_started')
+        if started_stack:
+            started_stack.pop()
+
+    def explain(self, statement, parameters):
+        """Returns the EXPLAIN QUERY PLAN details of a statement, on a separate connection."""
+        with self.engine.connect() as connection:
+            connection.info['profiler_explaining'] = True
+            try:
+                rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', tuple(parameters or ())).all()
+            finally:
+                connection.info.pop('profiler_explaining', None)
+        return [row[-1] for row in rows]
+
+    def _finish_request(self, response):
+        queries = g.pop('profiled_queries', None)
+        if queries is None:
+            return response
+        response.headers['X-Query-Count'] = str(len(queries))
+        label = f"{request.method} {request.path}"
+        report = []
+
+        shapes = {}
+        for statement, _, _, _ in queries:
+            shape = statement_shape(statement)
+            shapes[shape] = shapes.get(shape, 0) + 1
+        for shape, count in shapes.items():
+            if count >= self.repeated_threshold:
+                report.append(f"  N+1 candidate, run {count} times: {shape}")
+
+        for statement, parameters, executemany, seconds in queries:
+            if seconds < self.slow_query_seconds or executemany or not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            try:
+                plan = '; '.join(self.explain(statement, parameters))
+            except Exception as e:
+                plan = f"unavailable ({str(e)})"
+            report.append(f"  Slow statement, {seconds * 1000:.1f} ms: {statement_shape(statement)}\n"
+                          f"    plan: {plan}")
+
+        if report:
+            print('\n'.join([f"Query profile of {label}: {len(queries)} statements"] + report))
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and len(queries) > budget:
+            message = f"{label} ran {len(queries)} SQL statements, over its budget of {budget}"
+            if self.strict or current_app.testing:
+                raise QueryBudgetExceeded(message)
+            print(f"Warning: {message}")
+        return response
+
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,52 @@
+import os
+import hashlib
+import json
+import sqlite3
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_PATH = os.getenv('RECOMMENDATION_CACHE_PATH',
+                       os.path.join(os.path.dirname(__file__), '..', 'data', 'recommendations.db'))
+PRECOMPUTE = os.getenv('PRECOMPUTE_RECOMMENDATIONS', '0') == '1'
+
+
+def movie_list_hash(user_name, titles):
+    """Hashes the inputs of the recommendation prompt, ignoring the order of the titles."""
+    return hashlib.sha256(json.dumps([user_name, sorted(titles)]).encode('utf-8')).hexdigest()
+
+
+class RecommendationCache:
+    """Stores the latest AI recommendation of each user together with the hash of
+    the movie list it was generated from, so a changed list never gets a stale answer."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS recommendations '
+                               '(user_id TEXT PRIMARY KEY, list_hash TEXT NOT NULL, text TEXT NOT NULL, '
+                               'created_at REAL NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, user_id, list_hash):
+        """Returns the cached recommendation if it was made for this exact movie list."""
+        with self._connect() as connection:
+            row = connection.execute('SELECT text FROM recommendations WHERE user_id = ? AND list_hash = ?',
+                                     (user_id, list_hash)).fetchone()
+        return row[0] if row else None
+
+    def put(self, user_id, list_hash, text):
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO recommendations (user_id, list_hash, text, created_at) '
+                               'VALUES (?, ?, ?, ?)', (user_id, list_hash, text, time.time()))
+
+    def invalidate(self, user_id):
+        """Drops the user's recommendation after their movie list changed."""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM recommendations WHERE user_id = ?', (user_id,))
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,61 @@
+import os
+import random
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POOL_LOW_WATER = int(os.getenv('RANDOM_POOL_LOW_WATER', '5'))
+POOL_HIGH_WATER = int(os.getenv('RANDOM_POOL_HIGH_WATER', '20'))
+
+
+class ResponsePool:
+    """Keeps a pool of pre-generated responses, refilled by a background thread
+    whenever it drops below the low-water mark, so serving never waits on the API.
+    Served responses are kept around to fall back on while the pool is empty."""
+
+    def __init__(self, generate, low_water=POOL_LOW_WATER, high_water=POOL_HIGH_WATER):
+        self.generate = generate
+        self.low_water = low_water
+        self.high_water = high_water
+        self._fresh = deque()
+        self._served = deque(maxlen=high_water)
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def __len__(self):
+        return len(self._fresh)
+
+    def take(self):
+        """Returns a pooled response without blocking, or None if nothing was ever generated."""
+        with self._lock:
+            if self._fresh:
+                response = self._fresh.popleft()
+                self._served.append(response)
+            elif self._served:
+                response = random.choice(self._served)
+            else:
+                response = None
+        self.refill_if_needed()
+        return response
+
+    def refill_if_needed(self):
+        """Starts a background refill if the pool is below the low-water mark and none is running."""
+        with self._lock:
+            if self._refilling or len(self._fresh) >= self.low_water:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name='response-pool-refill', daemon=True).start()
+
+    def _refill(self):
+        try:
+            while len(self._fresh) < self.high_water:
+                response = self.generate()
+                with self._lock:
+                    self._fresh.append(response)
+        except Exception as e:
+            print(f"Error while refilling the response pool: {str(e)}")
+        finally:
+            with self._lock:
+                self._refilling = False
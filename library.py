@@ -0,0 +1,42 @@
+import argparse
+import sys
+
+from main import app, data_manager, movie_list_changed
+from moviweb_app.extended.library_io import read_titles, guess_format, import_movies, export_movies
+
+
+def main():
+    """Command line entry point for importing and exporting a user's movie library."""
+    parser = argparse.ArgumentParser(description="Import or export a MovieWeb App user's movie library.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="import titles from a CSV or JSON lines file")
+    import_parser.add_argument('user_id')
+    import_parser.add_argument('file', help="path of the file to import, '-' for standard input")
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], help="defaults to the file extension")
+
+    export_parser = subparsers.add_parser('export', help="export the library as CSV or JSON lines")
+    export_parser.add_argument('user_id')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    export_parser.add_argument('-o', '--output', help="path of the file to write, defaults to standard output")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'import':
+            file_format = args.format or guess_format(args.file)
+            handle = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+            with handle:
+                summary = import_movies(data_manager, args.user_id, read_titles(handle, file_format))
+            movie_list_changed(args.user_id)
+            print(f"Imported {summary['imported']} movies.")
+            for title in summary['not_found']:
+                print(f"  not found: {title}")
+        else:
+            handle = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+            with handle:
+                for chunk in export_movies(data_manager.iter_user_movies(args.user_id), args.format):
+                    handle.write(chunk)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,31 @@
+import io
 import os
+import glob
+import json
+import hashlib
+import threading
 
 from dotenv import load_dotenv
 from data_manager.sqlite_manager import SQLiteDataManager
-from flask_login import LoginManager, login_required, login_user, logout_user
-from flask import Flask, render_template, url_for, redirect, request, flash, session
-from moviweb_app.extended.login_handler import User
-from moviweb_app.extended.api_extractor import data_extractor, get_imdb_link
+from flask_login import LoginManager, login_required, login_user, logout_user, current_user
+from flask import Flask, render_template, url_for, redirect, request, flash, session, jsonify, abort, Response, \
+    stream_with_context, send_file, make_response
+from markupsafe import Markup
+from moviweb_app.extended.login_handler import User, user_cache
+from moviweb_app.extended.api_extractor import data_extractor, parse_movie_info
 from moviweb_app.extended.id_password_handler import generate_password_hash, id_generator, save_date, \
     check_password_hash
-from moviweb_app.extended.chat_gpt_interface import chat_interface, ai_prompt, ai_welcome, random_prompt
+from moviweb_app.extended.chat_gpt_interface import chat_interface, ai_prompt, ai_welcome, random_pool_prompt, \
+    personalize
+from moviweb_app.extended.job_queue import job_queue
+from moviweb_app.extended.recommendation_cache import recommendation_cache, movie_list_hash, PRECOMPUTE
+from moviweb_app.extended.response_pool import ResponsePool
+from moviweb_app.extended.library_io import read_titles, guess_format, import_movies, export_movies
+from moviweb_app.extended.fragment_cache import fragment_cache
+from moviweb_app.extended.metrics import metrics
+from moviweb_app.extended.query_profiler import query_profiler, query_budget, QUERY_PROFILING
+from moviweb_app.extended.poster_cache import poster_cache, poster_version, POSTER_SIZES, POSTER_MAX_AGE, \
+    PLACEHOLDER_SVG
 
 
 app = Flask(__name__)
@@ -19,32 +36,145 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{file_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = os.getenv('SECRET_KEY')
 data_manager = SQLiteDataManager(app)
+with app.app_context():
+    metrics.init_app(app, data_manager.db.engine)
+    if QUERY_PROFILING:
+        query_profiler.init_app(app, data_manager.db.engine)
 # app.register_blueprint(api)
 
 login_manager = LoginManager(app)
+
+USERS_PER_PAGE = 50
+MOVIES_PER_PAGE = 24
+REVIEWS_PER_PAGE = 20
+# Part of every ETag, so pages cached by browsers are refreshed after the templates change
+TEMPLATE_VERSION = max((os.path.getmtime(path) for path in
+                        glob.glob(os.path.join(app.root_path, 'templates', '*.html'))), default=0)
 # db.init_app(app)
 
 
+
+def get_recommendation(user_id):
+    """Returns the AI recommendation for the user's current movie list, asking the API only on a cache miss."""
+    user_name = data_manager.get_user_name(user_id)
+    user_movies = [movie.title for movie in data_manager.get_user_movies(user_id)]
+    list_hash = movie_list_hash(user_name, user_movies)
+    recommendation = recommendation_cache.get(user_id, list_hash)
+    if recommendation is None:
+        recommendation = chat_interface(ai_prompt(user_name, user_movies))
+        recommendation_cache.put(user_id, list_hash, recommendation)
+    return recommendation
+
+
+def precompute_recommendation(payload):
+    """Background job warming the recommendation cache after a movie list change."""
+    with app.app_context():
+        get_recommendation(payload['user_id'])
+
+
+def movie_list_changed(user_id):
+    """Drops the user's cached recommendation and optionally queues a new one."""
+    recommendation_cache.invalidate(user_id)
+    if PRECOMPUTE:
+        job_queue.enqueue('recommendation', {'user_id': user_id}, job_key=f'recommendation:{user_id}')
+
+
+job_queue.register('welcome_message', lambda payload: chat_interface(ai_welcome(payload['user_name'])))
+job_queue.register('recommendation', precompute_recommendation)
+
+random_movie_pool = ResponsePool(lambda: chat_interface(random_pool_prompt()))
+
+_background_started = False
+_background_lock = threading.Lock()
+
+
+@app.before_request
+def start_background_work():
+    """Starts the job workers and fills the random movie pool on the first request served,
+    rather than at import, so scripts importing the app (manage_db.py, library.py) neither
+    start workers nor make chat API calls."""
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if not _background_started:
+            job_queue.start()
+            random_movie_pool.refill_if_needed()
+            _background_started = True
+
+
+def conditional_get(version_keys, render):
+    """Answers a GET with 304 Not Modified when the client's ETag matches the current versions
+    of the entities the page shows, so a repeat view costs one counter lookup. Otherwise
+    calls render(versions) and tags the response. Errors raised by render are not tagged."""
+    versions = data_manager.get_versions(version_keys)
+    if versions is None or session.get('_flashes'):
+        # A pending flash message is part of the page
+        return render(None)
+    etag = hashlib.sha1(json.dumps([TEMPLATE_VERSION, versions, request.full_path,
+                                    current_user.get_id()]).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render(versions))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Revalidate on every view
+    return response
+
+
+def movie_grid(user_id, sort, cursor, versions):
+    """Renders one page of the user's movie grid, from the fragment cache when the user's
+    movies didn't change since. Returns (html, next_cursor)."""
+    def render():
+        movies, next_cursor = data_manager.get_user_movies_page(user_id, sort, cursor, MOVIES_PER_PAGE)
+        return Markup(render_template('movie_grid_items.html', movies=movies, user_id=user_id)), next_cursor
+
+    if versions is None:
+        return render()
+    return fragment_cache.get_or_render(('grid', user_id, sort, cursor, versions[f'user:{user_id}']), render)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    user_data = data_manager.get_user_data()
-    user = next((user for user in user_data if user['id'] == user_id), None)
+    user = user_cache.get(user_id)
     if user:
-        return User(user)
+        return user
+    user_data = data_manager.get_user_by_id(user_id)
+    if user_data:
+        user = User(user_data)
+        user_cache.put(user)
+        return user
     else:
         return None
 
 
+@app.template_global()
+def poster_src(movie_id, poster, size='thumb'):
+    """URL of the locally cached poster of a movie. The version parameter changes with
+    the poster URL, which lets browsers cache each address for good."""
+    return url_for('poster', movie_id=movie_id, size=size, v=poster_version(poster))
+
+
 @app.route('/')
 def home():
     return render_template('homepage.html')
 
 
 @app.route('/users')
+@query_budget(3)
 def list_users():
     try:
-        users = data_manager.get_user_data()
-        return render_template('users.html', users=users)
+        after_name = request.args.get('after')
+
+        def render(versions):
+            # Fetch one extra row to know whether there is a next page
+            users = data_manager.get_users_page(after_name, USERS_PER_PAGE + 1)
+            next_cursor = users[USERS_PER_PAGE - 1]['name'] if len(users) > USERS_PER_PAGE else None
+            return render_template('users.html', users=users[:USERS_PER_PAGE], next_cursor=next_cursor,
+                                   is_first_page=after_name is None)
+
+        return conditional_get(['users'], render)
     except TypeError as te:
         print(f"Error: {str(te)}")
         return render_template('error.html', error_message="Error retrieving users data")
@@ -60,11 +190,19 @@ def list_users():
 
 @app.route('/users/<user_id>')
 @login_required
+@query_budget(4)
 def list_user_movies(user_id):
     try:
-        user_name = data_manager.get_user_name(user_id)
-        movies = data_manager.get_user_movies(user_id)
-        return render_template('user_movies.html', movies=movies, user_name=user_name, user_id=user_id)
+        sort = request.args.get('sort', 'title')
+        welcome_pending = request.args.get('is_new_user') == 'True'
+
+        def render(versions):
+            user_name = data_manager.get_user_name(user_id)
+            grid_html, next_cursor = movie_grid(user_id, sort, None, versions)
+            return render_template('user_movies.html', grid_html=grid_html, user_name=user_name, user_id=user_id,
+                                   welcome_pending=welcome_pending, sort=sort, next_cursor=next_cursor)
+
+        return conditional_get([f'user:{user_id}'], render)
     except TypeError as te:
         print(f"Error: {str(te)}")
         return render_template('error.html', error_message="Error retrieving user data")
@@ -78,6 +216,35 @@ def list_user_movies(user_id):
         return render_template('error.html', error_message=error_message)
 
 
+@app.route('/users/<user_id>/movie_page')
+@login_required
+@query_budget(3)
+def user_movies_page(user_id):
+    """Returns the next page of the user's movie grid as an HTML fragment and the cursor of the page after it."""
+    sort = request.args.get('sort', 'title')
+
+    def render(versions):
+        html, next_cursor = movie_grid(user_id, sort, request.args.get('cursor'), versions)
+        return jsonify({'html': html, 'next_cursor': next_cursor})
+
+    try:
+        return conditional_get([f'user:{user_id}'], render)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/users/<user_id>/welcome_message')
+@login_required
+def welcome_message(user_id):
+    """Returns the status of the user's welcome message and its text once it is ready."""
+    if current_user.get_id() != user_id:
+        abort(404)
+    job = job_queue.get_job(f'welcome:{user_id}')
+    if job is None:
+        return jsonify({'status': 'missing', 'message': None})
+    return jsonify({'status': job['status'], 'message': job['result']})
+
+
 @app.route('/add_user', methods=['GET', 'POST'])
 def add_user():
     if request.method == 'POST':
@@ -89,19 +256,18 @@ def add_user():
         try:
             hashed_password = generate_password_hash(user_password)
             is_new_user = data_manager.add_user(user_name, hashed_password, user_id, email)
-            user_data = data_manager.get_user_data()
+            if not is_new_user:
+                error_message = "That user name is already taken. Please choose another one."
+                return render_template('add_user.html', error_message=error_message)
 
             session['user_id'] = user_id
             session['username'] = user_name
-            session['password'] = user_password
-            for user in user_data:
-                if user['name'] == user_name and check_password_hash(user['password'], user_password):
-                    user_id = user['id']
-                    user_obj = load_user(user_id)  # Create a User object
-                    login_user(user_obj)  # Log the user in
+            user_obj = load_user(user_id)  # Create a User object
+            login_user(user_obj)  # Log the user in
 
             if is_new_user:
-                flash(chat_interface(ai_welcome(user_name)))
+                # The welcome text comes from a slow remote API, generate it in the background
+                job_queue.enqueue('welcome_message', {'user_name': user_name}, job_key=f'welcome:{user_id}')
             # Redirect to the 'list_user_movies' route with is_new_user flag
             return redirect(url_for('list_user_movies', user_id=user_id, is_new_user=is_new_user))
 
@@ -122,28 +288,14 @@ def add_user():
 def add_movie(user_id):
     if request.method == 'POST':
         movie = request.form.get('movie')
-        movie_info = data_extractor(movie)
-        movie_link = get_imdb_link(movie)
+        movie_info = parse_movie_info(data_extractor(movie))
         try:
-            if movie_info is not None and 'Title' in movie_info and 'Year' in movie_info and 'Director' in movie_info:
-                title = movie_info.get("Title")
-                if len(movie_info['Ratings']) > 0:
-                    rating = float(movie_info['Ratings'][0]['Value'].split("/")[0])
-                else:
-                    rating = None
-
-                year_str = movie_info.get('Year')
-                if year_str.isdigit():
-                    year = int(year_str)
-                else:
-                    error_message = "Failed to retrieve movie information. Please try a different movie"
-                    return render_template('error.html', error_message=error_message)
-
-                poster = movie_info.get('Poster')
-                director = movie_info.get('Director')
+            if movie_info is not None:
                 movie_id = id_generator()
-
-                data_manager.add_movie(user_id, movie_id, title, rating, year, poster, director, movie_link)
+                data_manager.add_movie(user_id, movie_id, movie_info['title'], movie_info['rating'],
+                                       movie_info['year'], movie_info['poster'], movie_info['director'],
+                                       movie_info['movie_link'])
+                movie_list_changed(user_id)
 
                 return redirect(url_for('list_user_movies', user_id=user_id))
             else:
@@ -166,14 +318,47 @@ def add_movie(user_id):
     return render_template('add_movie.html', user_id=user_id)
 
 
+@app.route('/users/<user_id>/import_movies', methods=['POST'])
+@login_required
+def import_user_movies(user_id):
+    """Imports a CSV or JSON lines list of titles, sent as a 'file' upload or as the request body,
+    reading it line by line. Returns how many movies were imported and which titles were not found."""
+    if current_user.get_id() != user_id:
+        abort(404)
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, file_format = upload.stream, guess_format(upload.filename, upload.mimetype)
+    else:
+        stream, file_format = request.stream, guess_format(content_type=request.content_type)
+    try:
+        lines = io.TextIOWrapper(stream, encoding='utf-8')
+        summary = import_movies(data_manager, user_id, read_titles(lines, file_format))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f"Could not read the import file: {str(e)}"}), 400
+    except RuntimeError as e:
+        print(f"Error: {str(e)}")
+        return jsonify({'error': "An unexpected error occurred."}), 500
+    movie_list_changed(user_id)
+    return jsonify(summary)
+
+
+@app.route('/users/<user_id>/export_movies')
+@login_required
+def export_user_movies(user_id):
+    """Streams the user's movie library as CSV or JSON lines without loading it all in memory."""
+    if current_user.get_id() != user_id:
+        abort(404)
+    file_format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    mimetype = 'application/x-ndjson' if file_format == 'jsonl' else 'text/csv'
+    chunks = export_movies(data_manager.iter_user_movies(user_id), file_format)
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=movies.{file_format}'})
+
+
 @app.route('/users/<user_id>/update_movie/<movie_id>', methods=['GET', 'POST'])
+@query_budget(4)
 def update_movie(user_id, movie_id):
-    user_movie_list = data_manager.get_user_movies(user_id)
-    movie_to_update = None
-    for movie in user_movie_list:
-        if movie.movie_id == movie_id:
-            movie_to_update = movie
-            break
+    movie_to_update = data_manager.get_user_movie(user_id, movie_id)
 
     if movie_to_update is None:
         # Handle possible errors with the movie id
@@ -187,10 +372,14 @@ def update_movie(user_id, movie_id):
         updated_rating = request.form['rating']
         updated_poster_link = request.form['poster']
         updated_imdb_link = request.form['imdb_link']
-        new_movie_id = id_generator()
+        version = request.form.get('version', type=int)
         try:
-            data_manager.update_movie(user_id, movie_id, new_movie_id, title, updated_rating,
-                                      updated_year, updated_poster_link, updated_director, updated_imdb_link)
+            updated = data_manager.update_movie(user_id, movie_id, movie_id, title, updated_rating, updated_year,
+                                                updated_poster_link, updated_director, updated_imdb_link, version)
+            if not updated:
+                error_message = "This movie was changed in the meantime. Please reload the page and try again."
+                return render_template('error.html', error_message=error_message)
+            movie_list_changed(user_id)
 
             return redirect(url_for('list_user_movies', user_id=user_id))
 
@@ -213,10 +402,12 @@ def update_movie(user_id, movie_id):
 
 
 @app.route('/users/<user_id>/delete_movie/<movie_id>', methods=['GET', 'POST'])
+@query_budget(4)
 def delete_movie(user_id, movie_id):
     if request.method == 'POST':
         try:
             data_manager.delete_movie(user_id, movie_id)
+            movie_list_changed(user_id)
             print("Movie main deleted successfully")  # Add this line
             return redirect(url_for('list_user_movies', user_id=user_id))
 
@@ -233,21 +424,21 @@ def delete_movie(user_id, movie_id):
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@query_budget(4)  # Includes the UPDATE when the password hash is upgraded to the current bcrypt rounds
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         try:
-            user_data = data_manager.get_user_data()
-            for user in user_data:
-                if user['name'] == username and check_password_hash(user['password'], password):
-                    user_id = user['id']
-                    user_obj = load_user(user_id)  # Create a User object
-                    login_user(user_obj)  # Log the user in
-
-                    # Check if the user is new (just registered) and set is_new_user to True
-                    is_new_user = user.get('is_new_user', False)
-                    return redirect(url_for('list_user_movies', user_id=user_id, is_new_user=is_new_user))
+            user = data_manager.verify_user(username, password)
+            if user:
+                user_id = user['id']
+                user_obj = load_user(user_id)  # Create a User object
+                login_user(user_obj)  # Log the user in
+
+                # Check if the user is new (just registered) and set is_new_user to True
+                is_new_user = user.get('is_new_user', False)
+                return redirect(url_for('list_user_movies', user_id=user_id, is_new_user=is_new_user))
             else:
                 error_message = "Invalid credentials. Please try again."
                 return render_template('login.html', error_message=error_message)
@@ -280,11 +471,10 @@ def delete_user(user_id):
 
         if user_password == user_password_2:
             try:
-                user_data = data_manager.get_user_data()
-                for user in user_data:
-                    if check_password_hash(user['password'], user_password):
-                        data_manager.delete_user(user_id)
-                        return redirect(url_for('login'))
+                user = data_manager.get_user_by_id(user_id)
+                if user and check_password_hash(user['password'], user_password):
+                    data_manager.delete_user(user_id)
+                    return redirect(url_for('login'))
                 else:
                     error_message = "You are not authorized to delete this user."
                     return render_template('error.html', error_message=error_message)
@@ -306,25 +496,47 @@ def logout():
 
 
 @app.route('/movie_details/<movie_id>')
+@query_budget(4)  # Includes the user loader's lookup when the user cache is cold
 def movie_details(movie_id):
     """Displays the details of a movie along with their reviews and their authors
     and the buttons to add a review, delete and edit"""
     try:
-        movie = data_manager.get_movie_details(movie_id)
-        reviews = data_manager.get_all_movie_reviews(movie_id)
-        return render_template('movie_details.html', reviews=reviews, movie=movie)
+        sort = request.args.get('sort', 'date')
+        page = request.args.get('page', 1, type=int)
+
+        def render(versions):
+            # The edit and delete buttons depend on who is looking
+            key = ('reviews', movie_id, sort, page, current_user.get_id(),
+                   versions[f'movie:{movie_id}'] if versions else None)
+            reviews_html = fragment_cache.get(key) if versions else None
+            if reviews_html is not None:
+                movie = data_manager.get_movie_details(movie_id)
+            else:
+                movie, reviews, has_next_page = data_manager.get_movie_with_reviews(movie_id, sort, page,
+                                                                                    REVIEWS_PER_PAGE)
+                if movie is not None:
+                    reviews_html = Markup(render_template('review_list.html', reviews=reviews, movie_id=movie_id,
+                                                          sort=sort, page=page, has_next_page=has_next_page))
+                    if versions:
+                        fragment_cache.put(key, reviews_html)
+            if movie is None:
+                abort(404)
+            return render_template('movie_details.html', movie=movie, reviews_html=reviews_html, sort=sort)
+
+        return conditional_get([f'movie:{movie_id}'], render)
     except ValueError as e:
         error_message = str(e)
-        return render_template('general_error.html', error_message=error_message)
+        return render_template('error.html', error_message=error_message)
 
     except RuntimeError as e:
         error_message = "Error retrieving data from database"
         print(f"Error: {str(e)}")
-        return render_template('general_error.html', error_message=error_message)
+        return render_template('error.html', error_message=error_message)
 
 
 @app.route('/add_review/<user_id>/<movie_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(3)
 def add_review(user_id, movie_id):
     """Loads the add review template and allows the user to publish a review"""
     try:
@@ -335,8 +547,10 @@ def add_review(user_id, movie_id):
             review_title = request.form.get('review_title')
             review_text = request.form.get('review_text')
             try:
-                data_manager.add_reviews(review_id, user_id, movie_id, review_rating, 0, publication_date,
-                                         review_text, review_title)
+                added = data_manager.add_reviews(review_id, current_user.get_id(), movie_id, review_rating, 0,
+                                                 publication_date, review_text, review_title)
+                if not added:
+                    flash("Sorry, we could not publish your review.", 'error')
                 return redirect(url_for('movie_details', movie_id=movie_id))
             except ValueError as e:
                 flash(str(e), 'error')
@@ -347,11 +561,12 @@ def add_review(user_id, movie_id):
     except RuntimeError as e:
         error_message = "Error communicating with  database"
         print(f"Error: {str(e)}")
-        return render_template('general_error.html', error_message=error_message)
+        return render_template('error.html', error_message=error_message)
 
 
 @app.route('/edit_review/<user_id>/<movie_id>/<review_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(4)  # Includes the user loader's lookup when the user cache is cold
 def edit_review(user_id, movie_id, review_id):
     """Loads the edit review template and allows the user to edit
     an already submitted review if published by the user"""
@@ -361,46 +576,49 @@ def edit_review(user_id, movie_id, review_id):
             review_title = request.form['title']
             review_text = request.form['text']
             rating = request.form['rating']
-            data_manager.edit_reviews(review_id, user_id, movie_id, rating, review_text, review_title)
+            # Only the review's author can edit it, the update matches nothing otherwise
+            edited = data_manager.edit_reviews(review_id, current_user.get_id(), movie_id, rating, review_text,
+                                               review_title)
+            if not edited:
+                flash("Sorry, you can only edit your own reviews.", 'error')
             return redirect(url_for('movie_details', movie_id=movie_id))
         return render_template('edit_review.html', movie_id=movie_id, user_id=user_id, review=review)
     except ValueError as e:
         error_message = str(e)
-        return render_template('general_error.html', error_message=error_message)
+        return render_template('error.html', error_message=error_message)
 
     except RuntimeError as e:
         error_message = "Error retrieving data from database"
         print(f"Error: {str(e)}")
-        return render_template('general_error.html', error_message=error_message)
+        return render_template('error.html', error_message=error_message)
 
 
 @app.route('/delete_review/<user_id>/<movie_id>/<review_id>', methods=['POST'])
 @login_required
+@query_budget(3)  # Includes the user loader's lookup when the user cache is cold
 def delete_review(user_id, movie_id, review_id):
     """Allows the user to delete a review if published by him"""
     if request.method == 'POST':
         try:
-            data_manager.delete_reviews(user_id, movie_id, review_id)
+            # Only the review's author can delete it, the delete matches nothing otherwise
+            deleted = data_manager.delete_reviews(current_user.get_id(), movie_id, review_id)
+            if not deleted:
+                flash("Sorry, you can only delete your own reviews.", 'error')
             return redirect(url_for('movie_details', movie_id=movie_id))
         except ValueError as e:
             error_message = str(e)
-            return render_template('general_error.html', error_message=error_message)
+            return render_template('error.html', error_message=error_message)
 
         except RuntimeError as e:
             error_message = "Error retrieving data from database"
             print(f"Error: {str(e)}")
-            return render_template('general_error.html', error_message=error_message)
+            return render_template('error.html', error_message=error_message)
 
 
 @app.route('/users/<user_id>/movie_prompt')
 @login_required
 def ai_suggest_movie(user_id):
-    user_name = data_manager.get_user_name(user_id)
-    movies = data_manager.get_user_movies(user_id)
-    user_movies = []
-    for movie in movies:
-        user_movies.append(movie.title)
-    chatgpt_prompt = chat_interface(ai_prompt(user_name, user_movies))
+    chatgpt_prompt = get_recommendation(user_id)
 
     return render_template('chatgpt_movie.html', user_id=user_id, movie_prompt=chatgpt_prompt)
 
@@ -409,16 +627,48 @@ def ai_suggest_movie(user_id):
 @login_required
 def ai_random_movie(user_id):
     user_name = data_manager.get_user_name(user_id)
-    chatgpt_random_movie = chat_interface(random_prompt(user_name))
+    pooled_answer = random_movie_pool.take()
+    if pooled_answer is None:
+        chatgpt_random_movie = "We are still picking movies for you, please try again in a moment!"
+    else:
+        chatgpt_random_movie = personalize(pooled_answer, user_name)
     return render_template('chatgpt_random_movie.html', user_id=user_id, movie_prompt=chatgpt_random_movie)
 
 
+@app.route('/posters/<movie_id>')
+def poster(movie_id):
+    """Serves a movie poster from the local cache, fetching and resizing it on first use.
+    Shows a placeholder when the movie has no poster or the origin can't be reached."""
+    size = request.args.get('size', 'thumb')
+    if size not in POSTER_SIZES:
+        abort(404)
+    movie = data_manager.get_movie_details(movie_id)
+    if movie is None:
+        abort(404)
+    cached = poster_cache.get(movie.poster, size) if movie.poster and movie.poster != 'N/A' else None
+    if cached is None:
+        response = Response(PLACEHOLDER_SVG, mimetype='image/svg+xml')
+        response.cache_control.public = True
+        response.cache_control.max_age = 300  # Try the origin again soon
+        return response
+    path, etag, content_type = cached
+    response = send_file(path, mimetype=content_type, etag=etag, conditional=True, max_age=POSTER_MAX_AGE)
+    response.cache_control.public = True
+    if request.args.get('v') == poster_version(movie.poster):
+        response.cache_control.immutable = True
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Exposes this process's request, SQL, outbound call and bcrypt figures for Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(404)
 def page_not_found(e):
-    users = data_manager.get_user_data()
-    for user in users:
-        user_id = user['id']
-        return render_template('404.html', user_id=user_id), 404
+    # The way back leads to the visitor's own movies, or home when nobody is logged in
+    return render_template('404.html', user_id=current_user.get_id()), 404
 
 
 if __name__ == '__main__':
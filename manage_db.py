@@ -0,0 +1,42 @@
+import argparse
+
+from main import app, data_manager
+from data_manager.migrations import MIGRATIONS, get_schema_version, pending_migrations, migrate, find_table_scans, \
+    MigrationError
+
+
+def main():
+    """Command line entry point for applying and checking the SQLite schema migrations."""
+    parser = argparse.ArgumentParser(description="Manage the MovieWeb App database schema.")
+    parser.add_argument('command', choices=['migrate', 'status', 'check'], nargs='?', default='migrate',
+                        help="migrate: apply pending migrations, status: show the schema version, "
+                             "check: verify the hot queries use an index")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db = data_manager.db
+        if args.command == 'status':
+            print(f"Schema version {get_schema_version(db)} of {MIGRATIONS[-1][0]}")
+            for version, description, _ in pending_migrations(db):
+                print(f"  pending {version}: {description}")
+        elif args.command == 'check':
+            if pending_migrations(db):
+                print("The database has pending migrations, run 'migrate' first.")
+                raise SystemExit(1)
+            table_scans = find_table_scans(db)
+            for name, plan in table_scans.items():
+                print(f"{name} scans a table: {'; '.join(plan)}")
+            if table_scans:
+                raise SystemExit(1)
+            print("All queries use an index.")
+        else:
+            try:
+                applied = migrate(db)
+            except MigrationError as e:
+                print(f"Migration stopped at schema version {get_schema_version(db)}.\n{str(e)}")
+                raise SystemExit(1)
+            print(f"Applied migrations: {applied}" if applied else "Database is up to date.")
+
+
+if __name__ == '__main__':
+    main()
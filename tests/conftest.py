@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from benchmarks.fakes import start_fake_apis  # noqa: E402
+
+# The first request starts the job workers and fills the random movie pool, so the app must
+# never see the real OMDb and chat APIs from a test run
+FAKE_APIS = start_fake_apis()
+
+# main reads its configuration when imported, so point it at scratch files first
+WORK_DIR = tempfile.mkdtemp(prefix='moviweb-tests-')
+os.environ.update({
+    'DATABASE_URL': os.path.join(WORK_DIR, 'movies.sqlite'),
+    'SECRET_KEY': 'test',
+    'QUERY_PROFILING': '1',
+    'BCRYPT_ROUNDS': '4',
+    'MOVIE_API_KEY': 'fake',
+    'RAPID_API_KEY': 'fake',
+    'OMDB_URL': f'{FAKE_APIS.base_url}/omdb/',
+    'CHAT_API_URL': f'{FAKE_APIS.base_url}/chat/',
+    'OMDB_CACHE_PATH': os.path.join(WORK_DIR, 'omdb_cache.db'),
+    'JOBS_DB_PATH': os.path.join(WORK_DIR, 'jobs.db'),
+    'RECOMMENDATION_CACHE_PATH': os.path.join(WORK_DIR, 'recommendations.db'),
+    'POSTER_DIR': os.path.join(WORK_DIR, 'posters'),
+    'POSTER_INDEX_PATH': os.path.join(WORK_DIR, 'posters.db'),
+})
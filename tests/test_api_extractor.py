@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from benchmarks.fakes import FakeApiHandler, start_fake_apis  # noqa: E402
+from moviweb_app.extended import api_extractor  # noqa: E402
+from moviweb_app.extended.api_extractor import OmdbCache, SingleFlight, NOT_FOUND_ERROR  # noqa: E402
+
+UNKNOWN_TITLE = 'No Such Movie'
+LIMITED_TITLE = 'Over The Limit'
+
+
+class CountingOmdbHandler(FakeApiHandler):
+    """The benchmark's fake OMDb, answering 'not found' and 'request limit reached' for two
+    titles and counting the lookups of each title."""
+
+    def do_GET(self):
+        title = parse_qs(urlsplit(self.path).query).get('t', [''])[0]
+        with self.server.lock:
+            self.server.lookups[title] = self.server.lookups.get(title, 0) + 1
+        errors = {UNKNOWN_TITLE: NOT_FOUND_ERROR, LIMITED_TITLE: 'Request limit reached!'}
+        if title in errors:
+            self._send(f'{{"Response": "False", "Error": "{errors[title]}"}}'.encode('utf-8'), 'application/json')
+            return
+        super().do_GET()
+
+
+@pytest.fixture(scope='module')
+def fake_omdb():
+    server = start_fake_apis(latency=0.2, handler=CountingOmdbHandler)
+    server.lock = threading.Lock()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def omdb(fake_omdb, tmp_path, monkeypatch):
+    """Points the extractor at the fake server and an empty cache. Returns the lookup counts."""
+    fake_omdb.lookups = {}
+    monkeypatch.setattr(api_extractor, 'OMDB_URL', f'{fake_omdb.base_url}/omdb/')
+    monkeypatch.setattr(api_extractor, '_cache', OmdbCache(str(tmp_path / 'omdb_cache.db'), ttl=60, negative_ttl=10))
+    return fake_omdb.lookups
+
+
+def test_one_outbound_call_per_title(omdb):
+    first = api_extractor.data_extractor('Alien')
+    # Titles differing only in case and surrounding spaces share the cache entry
+    assert api_extractor.data_extractor('  alien ') == first
+    assert first['Title'] == 'Alien'
+    assert omdb == {'Alien': 1}
+
+
+def test_imdb_link_is_derived_from_the_payload(omdb):
+    payload = api_extractor.data_extractor('Alien')
+    assert api_extractor.get_imdb_link('Alien') == f"https://www.imdb.com/title/{payload['imdbID']}/"
+    assert api_extractor.parse_movie_info(payload)['movie_link'] == api_extractor.get_imdb_link('Alien')
+    assert api_extractor.imdb_link_from_data({'Response': 'False', 'Error': NOT_FOUND_ERROR}) is None
+    assert omdb == {'Alien': 1}
+
+
+def test_entries_expire_after_their_ttl(omdb, monkeypatch):
+    api_extractor.data_extractor('Alien')
+    api_extractor.data_extractor(UNKNOWN_TITLE)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 30)  # Past the negative TTL only
+    api_extractor.data_extractor('Alien')
+    api_extractor.data_extractor(UNKNOWN_TITLE)
+    assert omdb == {'Alien': 1, UNKNOWN_TITLE: 2}
+    monkeypatch.setattr(time, 'time', lambda: now + 90)  # Past both TTLs
+    api_extractor.data_extractor('Alien')
+    assert omdb == {'Alien': 2, UNKNOWN_TITLE: 2}
+
+
+def test_only_not_found_answers_are_cached(omdb):
+    for _ in range(2):
+        assert api_extractor.data_extractor(UNKNOWN_TITLE)['Error'] == NOT_FOUND_ERROR
+        assert api_extractor.data_extractor(LIMITED_TITLE)['Response'] == 'False'
+    assert omdb == {UNKNOWN_TITLE: 1, LIMITED_TITLE: 2}
+
+
+def test_concurrent_lookups_share_one_request(omdb):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def lookup():
+        barrier.wait()
+        results.append(api_extractor.data_extractor('Heat'))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    assert omdb == {'Heat': 1}
+
+
+def test_single_flight_shares_the_leaders_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, errors = [], []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        release.wait()
+        raise ValueError('boom')
+
+    def call():
+        try:
+            flight.do('key', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)  # Let the follower join the call in flight
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(calls) == 1 and len(errors) == 2
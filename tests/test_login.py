@@ -0,0 +1,37 @@
+import pytest
+
+from main import app, data_manager
+from data_manager.migrations import migrate
+from moviweb_app.extended.id_password_handler import password_hasher, generate_password_hash
+
+
+@pytest.fixture(scope='module')
+def user():
+    app.testing = True
+    with app.app_context():
+        migrate(data_manager.db)
+        data_manager.add_user('alice', generate_password_hash('secret'), 'user-alice', None)
+    return 'alice', 'secret'
+
+
+def login(username, password):
+    return app.test_client().post('/login', data={'username': username, 'password': password})
+
+
+def test_login_within_query_budget(user):
+    response = login(*user)
+    assert response.status_code == 302
+
+
+def test_login_after_changing_rounds_upgrades_hash_within_budget(user, monkeypatch):
+    monkeypatch.setattr(password_hasher, 'rounds', password_hasher.rounds + 1)
+    response = login(*user)
+    assert response.status_code == 302
+    with app.app_context():
+        stored = data_manager.get_user_by_name(user[0])['password']
+    assert not password_hasher.needs_rehash(stored)
+    assert login(*user).status_code == 302
+
+
+def test_login_with_wrong_password(user):
+    assert login(user[0], 'wrong').status_code == 200  # The login form again, not a redirect
@@ -0,0 +1,48 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from data_manager.data_models import User  # noqa: E402
+from data_manager.migrations import MIGRATIONS, MigrationError, get_schema_version, migrate  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A database at schema version 1, as left by the first migration, with two users sharing a name."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'movies.sqlite'}")
+    with engine.begin() as connection:
+        # The user table as it was before names were unique
+        connection.execute(text('CREATE TABLE user (id VARCHAR NOT NULL PRIMARY KEY, name VARCHAR(100), '
+                                'password VARCHAR(100), email VARCHAR(100))'))
+        connection.execute(text("INSERT INTO user (id, name, password) VALUES "
+                                "('user-1', 'alice', 'hash'), ('user-2', 'alice', 'hash'), ('user-3', 'bob', 'hash')"))
+        connection.execute(text('PRAGMA user_version = 1'))
+    User.metadata.create_all(bind=engine)
+    yield SimpleNamespace(engine=engine)
+    engine.dispose()
+
+
+def test_duplicate_user_names_stop_the_migration_with_guidance(db):
+    with pytest.raises(MigrationError) as error:
+        migrate(db)
+    assert "'alice': user IDs user-1, user-2" in str(error.value)
+    assert 'bob' not in str(error.value)
+    assert get_schema_version(db) == 1
+    with db.engine.connect() as connection:
+        indexes = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+    assert 'ix_user_name' not in indexes
+
+
+def test_migration_resumes_once_the_names_are_unique(db):
+    with pytest.raises(MigrationError):
+        migrate(db)
+    with db.engine.begin() as connection:
+        connection.execute(text("UPDATE user SET name = 'alice-2' WHERE id = 'user-2'"))
+    assert migrate(db) == [version for version, _, _ in MIGRATIONS[1:]]
+    assert get_schema_version(db) == MIGRATIONS[-1][0]
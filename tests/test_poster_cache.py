@@ -0,0 +1,58 @@
+import os
+import socket
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from benchmarks.fakes import start_fake_apis  # noqa: E402
+from moviweb_app.extended.poster_cache import PosterCache, allowed_poster_url, check_public_address  # noqa: E402
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1', '10.1.2.3', '169.254.169.254', '::1', '::ffff:192.168.0.1',
+                                     'fe80::1%eth0'])
+def test_non_public_addresses_are_rejected(address):
+    with pytest.raises(ValueError):
+        check_public_address('m.media-amazon.com', address)
+
+
+def test_public_addresses_pass():
+    check_public_address('m.media-amazon.com', '93.184.216.34')
+    check_public_address('m.media-amazon.com', '2606:2800:220:1:248:1893:25c8:1946')
+
+
+def test_only_http_urls_on_poster_hosts_are_allowed():
+    assert allowed_poster_url('https://m.media-amazon.com/images/poster.jpg')
+    assert allowed_poster_url('http://images.m.media-amazon.com/poster.jpg')
+    assert not allowed_poster_url('https://m.media-amazon.com.evil.example/poster.jpg')
+    assert not allowed_poster_url('file:///etc/passwd')
+    assert not allowed_poster_url('http://127.0.0.1/poster.jpg')
+
+
+def test_allowed_name_resolving_to_a_private_address_is_never_contacted(tmp_path, monkeypatch):
+    # A rebinding DNS server: a public address for the first lookup, loopback after that
+    server = start_fake_apis()
+    requests_seen = []
+    do_get = server.RequestHandlerClass.do_GET
+    monkeypatch.setattr(server.RequestHandlerClass, 'do_GET', lambda self: (requests_seen.append(self.path), do_get(self)))
+    resolve = socket.getaddrinfo
+    lookups = []
+
+    def rebinding_getaddrinfo(host, *args, **kwargs):
+        if host == 'm.media-amazon.com':
+            lookups.append(host)
+            host = '93.184.216.34' if len(lookups) == 1 else '127.0.0.1'
+        return resolve(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', rebinding_getaddrinfo)
+    cache = PosterCache(str(tmp_path / 'posters'), str(tmp_path / 'posters.db'))
+    try:
+        for scheme in ('http', 'https'):
+            lookups.clear()
+            url = f'{scheme}://m.media-amazon.com:{server.server_address[1]}/poster/abc.jpg'
+            assert cache.get(url) is None
+    finally:
+        server.shutdown()
+    assert requests_seen == []
@@ -0,0 +1,116 @@
+"""Every route with a query_budget, run with a cold user cache. The first request of a
+worker, or any request 300 s after the last one of that user, has the user loader look
+the user up, and the budgets must leave room for it. Over-budget routes raise while the
+app is testing."""
+import pytest
+
+from main import app, data_manager
+from data_manager.migrations import migrate
+from moviweb_app.extended.id_password_handler import generate_password_hash
+from moviweb_app.extended.login_handler import user_cache
+
+USER_ID = 'user-carol'
+
+
+@pytest.fixture(scope='module')
+def client():
+    app.testing = True
+    with app.app_context():
+        migrate(data_manager.db)
+        data_manager.add_user('carol', generate_password_hash('secret'), USER_ID, None)
+        data_manager.add_movies(USER_ID, [
+            {'movie_id': f'carol-movie-{number}', 'title': f'Movie {number}', 'rating': 7, 'year': 2000 + number,
+             'poster': '', 'director': 'Director', 'movie_link': f'https://www.imdb.com/title/tt{number + 100:07d}/'}
+            for number in range(30)])
+    client = app.test_client()
+    assert client.post('/login', data={'username': 'carol', 'password': 'secret'}).status_code == 302
+    return client
+
+
+def add_review(review_id, movie_id='carol-movie-1'):
+    with app.app_context():
+        assert data_manager.add_reviews(review_id, USER_ID, movie_id, 7, 0, '01-01-2024', 'Text', 'Title') == 1
+
+
+def movie_row_id(movie_id):
+    with app.app_context():
+        return data_manager.get_user_movie(USER_ID, movie_id).id
+
+
+def cold(client, method, url, **kwargs):
+    """Sends the request with nobody in the user cache."""
+    user_cache.clear()
+    return client.open(url, method=method, **kwargs)
+
+
+def test_list_users(client):
+    assert cold(client, 'GET', '/users').status_code == 200
+    assert cold(client, 'GET', '/users?after=a').status_code == 200
+
+
+def test_list_user_movies(client):
+    for sort in ('title', 'year', 'rating'):
+        assert cold(client, 'GET', f'/users/{USER_ID}?sort={sort}').status_code == 200
+
+
+def test_user_movies_page(client):
+    first_page = cold(client, 'GET', f'/users/{USER_ID}/movie_page?sort=year').get_json()
+    assert first_page['next_cursor']
+    response = cold(client, 'GET', f"/users/{USER_ID}/movie_page?sort=year&cursor={first_page['next_cursor']}")
+    assert response.status_code == 200
+
+
+def test_update_movie(client):
+    assert cold(client, 'GET', f'/users/{USER_ID}/update_movie/carol-movie-3').status_code == 200
+    response = cold(client, 'POST', f'/users/{USER_ID}/update_movie/carol-movie-3',
+                    data={'director': 'Someone Else', 'year': '2003', 'rating': '8', 'poster': '', 'imdb_link': '',
+                          'version': '1'})
+    assert response.status_code == 302
+
+
+def test_delete_movie(client):
+    row_id = movie_row_id('carol-movie-4')
+    assert cold(client, 'POST', f'/users/{USER_ID}/delete_movie/{row_id}').status_code == 302
+    assert cold(client, 'POST', f'/users/{USER_ID}/delete_movie/{row_id}').status_code == 302
+
+
+def test_login(client):
+    assert cold(app.test_client(), 'GET', '/login').status_code == 200
+    assert cold(app.test_client(), 'POST', '/login', data={'username': 'carol', 'password': 'secret'}).status_code == 302
+
+
+def test_movie_details(client):
+    add_review('carol-review-details', 'carol-movie-5')
+    for query in ('', '?sort=likes', '?page=5'):
+        assert cold(client, 'GET', f'/movie_details/carol-movie-5{query}').status_code == 200
+    # The second view of a page takes its reviews from the fragment cache
+    assert cold(client, 'GET', '/movie_details/carol-movie-5?sort=likes').status_code == 200
+    assert cold(client, 'GET', '/movie_details/no-such-movie').status_code == 404
+    assert cold(app.test_client(), 'GET', '/movie_details/no-such-movie').status_code == 404
+
+
+def test_add_review(client):
+    assert cold(client, 'GET', f'/add_review/{USER_ID}/carol-movie-6').status_code == 200
+    response = cold(client, 'POST', f'/add_review/{USER_ID}/carol-movie-6',
+                    data={'rating': '6', 'review_title': 'Title', 'review_text': 'Text'})
+    assert response.status_code == 302
+
+
+def test_edit_review(client):
+    add_review('carol-review-edit')
+    assert cold(client, 'GET', f'/edit_review/{USER_ID}/carol-movie-1/carol-review-edit').status_code == 200
+    response = cold(client, 'POST', f'/edit_review/{USER_ID}/carol-movie-1/carol-review-edit',
+                    data={'title': 'Title', 'text': 'Edited', 'rating': '8'})
+    assert response.status_code == 302
+
+
+def test_delete_review(client):
+    add_review('carol-review-delete')
+    for _ in range(2):  # The second finds nothing to delete
+        assert cold(client, 'POST', f'/delete_review/{USER_ID}/carol-movie-1/carol-review-delete').status_code == 302
+
+
+def test_every_budgeted_route_is_covered():
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    tested = {name[len('test_'):] for name in globals() if name.startswith('test_')}
+    assert budgeted <= tested
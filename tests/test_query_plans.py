@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from data_manager.migrations import migrate  # noqa: E402
+from data_manager.sqlite_manager import SQLiteDataManager  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def data_manager(tmp_path_factory):
+    """A migrated database with a few users, movies and reviews, so the planner sees real tables."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path_factory.mktemp('plans') / 'movies.sqlite'}"
+    manager = SQLiteDataManager(app)
+    with app.app_context():
+        migrate(manager.db)
+        for number in range(3):
+            manager.add_user(f'user-{number}', 'hash', f'id-{number}', None)
+            manager.add_movies(f'id-{number}', [
+                {'movie_id': f'movie-{number}-{index}', 'title': f'Movie {index}', 'rating': 7, 'year': 2000 + index,
+                 'poster': '', 'director': 'Director', 'movie_link': f'https://www.imdb.com/title/tt{index:07d}/'}
+                for index in range(5)])
+            manager.add_reviews(f'review-{number}', f'id-{number}', 'movie-0-0', 8, 0, '01-01-2024', 'Text', 'Title')
+        yield manager
+
+
+def run_and_capture(manager, calls):
+    """Runs the manager calls and returns the (statement, parameters) pairs they sent to SQLite."""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(('PRAGMA', 'EXPLAIN')):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(manager.db.engine, 'before_cursor_execute', capture)
+    try:
+        for call in calls:
+            call()
+    finally:
+        event.remove(manager.db.engine, 'before_cursor_execute', capture)
+    return statements
+
+
+def test_hot_queries_use_an_index(data_manager):
+    movie_row_id = data_manager.get_user_movie('id-1', 'movie-1-1').id
+    calls = [
+        lambda: data_manager.get_versions(['users', 'user:id-0']),
+        lambda: data_manager.get_user_by_id('id-0'),
+        lambda: data_manager.get_user_by_name('user-0'),
+        lambda: data_manager.get_user_name('id-0'),
+        lambda: data_manager.get_users_page('user-0', 50),
+        lambda: data_manager.get_user_movies('id-0'),
+        lambda: data_manager.get_user_movie('id-0', 'movie-0-1'),
+        lambda: data_manager.get_user_movies_page('id-0', 'title', None, 2),
+        lambda: data_manager.get_user_movies_page('id-0', 'year', data_manager.get_user_movies_page(
+            'id-0', 'year', None, 2)[1], 2),
+        lambda: data_manager.update_movie('id-0', 'movie-0-1', 'movie-0-1', 'Movie 1', 9, 2001, '', 'Director',
+                                          'https://www.imdb.com/title/tt0000001/', 1),
+        lambda: data_manager.delete_movie('id-1', movie_row_id),
+        lambda: data_manager.get_movie_details('movie-0-0'),
+        lambda: data_manager.get_movie_with_reviews('movie-0-0', 'date', 1, 20),
+        lambda: data_manager.get_movie_with_reviews('movie-0-0', 'likes', 1, 20),
+        lambda: data_manager.get_review_info('review-0'),
+        lambda: data_manager.get_all_movie_reviews('movie-0-0'),
+        lambda: data_manager.add_reviews('review-new', 'id-2', 'movie-0-1', 6, 0, '02-01-2024', 'Text', 'Title'),
+        lambda: data_manager.edit_reviews('review-new', 'id-2', 'movie-0-1', 7, 'Edited', 'Title'),
+        lambda: data_manager.delete_reviews('id-2', 'movie-0-1', 'review-new'),
+    ]
+    statements = run_and_capture(data_manager, calls)
+    assert len(statements) >= len(calls)
+
+    table_scans = []
+    with data_manager.db.engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}',
+                                                                  parameters).all()]
+            # VALUES lists and SELECTs without a FROM clause show up as a scan of constant rows
+            if any(detail.startswith('SCAN') and 'CONSTANT ROW' not in detail for detail in plan):
+                table_scans.append(f"{' '.join(statement.split())}\n    {'; '.join(plan)}")
+    assert not table_scans, 'Statements scanning a table:\n' + '\n'.join(table_scans)
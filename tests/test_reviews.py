@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(ROOT)]
+
+from data_manager.migrations import migrate  # noqa: E402
+from data_manager.sqlite_manager import SQLiteDataManager  # noqa: E402
+
+MOVIE = {'movie_id': 'movie-1', 'title': 'Heat', 'rating': 8, 'year': 1995, 'poster': '', 'director': 'Michael Mann',
+         'movie_link': 'https://www.imdb.com/title/tt0113277/'}
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A migrated database with one movie and two users, alice and bob."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'movies.sqlite'}"
+    app.data_manager = SQLiteDataManager(app)
+    with app.app_context():
+        migrate(app.data_manager.db)
+        app.data_manager.add_user('alice', 'hash', 'alice-id', None)
+        app.data_manager.add_user('bob', 'hash', 'bob-id', None)
+        app.data_manager.add_movies('alice-id', [MOVIE])
+    return app
+
+
+@pytest.fixture
+def data_manager(app):
+    with app.app_context():
+        yield app.data_manager
+
+
+def add_review(data_manager, review_id='review-1', user_id='alice-id', movie_id='movie-1'):
+    return data_manager.add_reviews(review_id, user_id, movie_id, 7, 0, '01-01-2024', 'Text', 'Title')
+
+
+def test_review_needs_an_existing_movie_and_user(data_manager):
+    assert add_review(data_manager, movie_id='no-such-movie') == 0
+    assert add_review(data_manager, user_id='no-such-user') == 0
+    assert data_manager.get_review_info('review-1') is None
+    assert add_review(data_manager) == 1
+    assert data_manager.get_review_info('review-1').user_id == 'alice-id'
+
+
+def test_only_the_author_can_edit_or_delete(data_manager):
+    add_review(data_manager)
+    assert data_manager.edit_reviews('review-1', 'bob-id', 'movie-1', 1, 'Hijacked', 'Title') == 0
+    assert data_manager.edit_reviews('review-1', 'alice-id', 'other-movie', 1, 'Hijacked', 'Title') == 0
+    assert data_manager.delete_reviews('bob-id', 'movie-1', 'review-1') == 0
+    assert data_manager.get_review_info('review-1').review_text == 'Text'
+
+    assert data_manager.edit_reviews('review-1', 'alice-id', 'movie-1', 9, 'Edited', 'Title') == 1
+    assert data_manager.get_review_info('review-1').review_text == 'Edited'
+    assert data_manager.delete_reviews('alice-id', 'movie-1', 'review-1') == 1
+    assert data_manager.get_review_info('review-1') is None
+
+
+def run_concurrently(app, *calls):
+    """Runs each call(data_manager) in its own thread, all released at once, each in its own
+    app context and so its own session. Returns their results in the order of the calls."""
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def worker(index, call):
+        with app.app_context():
+            barrier.wait()
+            results[index] = call(app.data_manager)
+
+    threads = [threading.Thread(target=worker, args=item) for item in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def delete_as(user_id):
+    return lambda manager: manager.delete_reviews(user_id, 'movie-1', 'review-1')
+
+
+def edit_as(user_id):
+    return lambda manager: manager.edit_reviews('review-1', user_id, 'movie-1', 9, 'Edited', 'Title')
+
+
+@pytest.mark.parametrize('round_number', range(5))
+def test_concurrent_deletes_remove_the_review_once(app, data_manager, round_number):
+    add_review(data_manager)
+    assert sorted(run_concurrently(app, delete_as('alice-id'), delete_as('alice-id'))) == [0, 1]
+
+
+@pytest.mark.parametrize('round_number', range(5))
+def test_edit_racing_a_delete_applies_to_an_existing_review_only(app, data_manager, round_number):
+    add_review(data_manager)
+    edited, deleted = run_concurrently(app, edit_as('alice-id'), delete_as('alice-id'))
+    # The delete always finds the review; the edit only does if it commits first
+    assert deleted == 1
+    assert edited in (0, 1)
+    assert data_manager.get_review_info('review-1') is None
+
+
+def test_concurrent_edits_by_author_and_stranger(app, data_manager):
+    add_review(data_manager)
+    assert run_concurrently(app, edit_as('alice-id'), edit_as('bob-id')) == [1, 0]
+    data_manager.db.session.expire_all()
+    assert data_manager.get_review_info('review-1').review_text == 'Edited'